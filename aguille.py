@@ -5,6 +5,11 @@
 Usage:
   aguille.py tags [options] (-o CSV) LAYOUTS [--values VALUES]
   aguille.py tags [options] (-o CSV) (--repo REPOSITORY) [--dirlist DIRLIST]
+  aguille.py tags [options] (-o CSV) (--apks APKS) [--dirlist DIRLIST]
+  aguille.py diff [options] (-o CSV) STATE (--repo REPOSITORY) [--dirlist DIRLIST]
+  aguille.py diff [options] (-o CSV) STATE (--apks APKS) [--dirlist DIRLIST]
+  aguille.py merge [options] (-o CSV) PARTIALS...
+  aguille.py query [options] INDEX TAGS...
   aguille.py (-h | --help | help)
   aguille.py --version
 
@@ -13,13 +18,34 @@ Arguments:
   LAYOUTS     Path to res/layouts.
   VALUES      Path to res/values.
   REPOSITORY  Path to a folder of Android packages.
+  APKS        Path to a folder of APK files.
   DIRLIST     Path to the output of getRepoDirs or getArgDirs.
+  PARTIALS    Paths to CSVs written by sharded runs.
+  INDEX       Path to a tag index written with --index.
+  TAGS        Tags an app must all use, each written TAG or TAG:MINIMUM.
+  STATE       Path to the state diff keeps between runs; made if missing.
 
 Options:
   tags        Analyze tags and run counts for each application.
+  diff        Analyze only the applications that changed since the last diff
+              with STATE, and write what changed in their rows to CSV.
+  merge       Combine the CSVs of sharded runs into one.
+  query       List the apps in a tag index that use all of TAGS.
   --custom    Also analyze app-defined tags (not just stock Android tags).
   --blanks    In the absence of data, put nothing (instead of a zero) in the CSV.
   --cache     Write to (rather than read from) DIRLIST.
+  --prefetch DEPTH  Read up to DEPTH applications ahead of the parser; 0 reads
+                    each one just before parsing it [default: 2].
+  --readers N       Number of threads reading ahead [default: 1].
+  --checkpoint FILE  Record progress in FILE as the run goes.
+  --resume          Continue the run recorded in the checkpoint FILE.
+  --shard SHARD     Only analyze shard K of N (SHARD is written K/N, 1 <= K <= N),
+                    writing to a CSV named for the shard.
+  --index FILE      Also build a tag index in FILE for the query command.
+  --parser NAME     Parse layouts with NAME, bs4 or lxml [default: bs4].
+  --min COUNT       Default minimum uses of each queried tag [default: 1].
+  --fields          Also list each queried app's rating fields.
+  --count           Only count the queried apps.
   -l LOGFILE  Log output to a file.
   -v          Increase verbosity.
   -h --help   Show this screen.
@@ -29,18 +55,22 @@ aguille is written by Quint Guvernator and licensed by the GPLv3."""
 
 VERSION = "indev"
 
+# Only cheap modules are imported here. Anything heavy (bs4, statistics,
+# subprocess, zipfile, the thread pool, docopt itself) is imported by the
+# function that needs it, so a run only pays for what it uses.
 import sys
-from docopt import docopt
 import pathlib
-import statistics
 import csv
 import os
 from itertools import chain
-from subprocess import check_call
-import json
+import functools
+import struct
 
-from bs4 import BeautifulSoup
-bs = lambda x: BeautifulSoup(x, "xml")
+import axml  # local
+import checkpoint  # local
+import dedup  # local
+import parsers  # local
+import reader  # local
 
 
 def echo(x):
@@ -49,29 +79,31 @@ def echo(x):
     _wipe()
 
 def _echo(x):
+    from subprocess import check_call
     call = ["echo", "-n", x]
     check_call(call)
 
 def _wipe():
+    from subprocess import check_call
     check_call(["echo", "-en", r"\e[0K\r"])
 
-def countLayoutButtons(soup: "soup from an XML layout") -> int:
+def countLayoutButtons(soup: "soup from an XML layout", *, parser=None) -> int:
     '''Count how many buttons are defined in a layout.'''
-    return len(soup("Button"))
+    return parsers.get(parser).countButtons(soup)
 
-def countTags(soup: "soup from an XML layout", *, custom=True) -> dict:
-    '''Return a dictionary listing the freqency of each tag type by name.'''
+def countTags(soup: "soup from an XML layout", *, custom=True, parser=None) -> dict:
+    '''Return a dictionary listing the freqency of each tag type by name.
+    The layout is a document from the named parser (see parsers.py).'''
 
     tagCount = dict()
 
-    tags = soup.find_all(True)  # TODO
+    names = parsers.get(parser).tagNames(soup)
 
-    for tag in tags:
+    for name in names:
         # increase int by one
-        name = tag.name
-        if tag.name is None:
+        if name is None:
             continue
-        if not custom and '.' in tag.name:
+        if not custom and '.' in name:
             continue
         key = "tag_{}".format(name)
 
@@ -80,28 +112,18 @@ def countTags(soup: "soup from an XML layout", *, custom=True) -> dict:
 
     return tagCount
 
-def countAppButtons(layoutsPath: pathlib.Path) -> [int, ...]:
+def countAppButtons(layoutsPath: pathlib.Path, *, parser=None) -> [int, ...]:
     '''Count how many buttons are defined in each layout in an application's
     layouts directory.'''
 
-    layouts, _ = appSoup(layoutsPath)
-    return [ countLayoutButtons(soup) for soup in layouts ]
+    layouts, _ = appSoup(layoutsPath, parser=parser)
+    return [ countLayoutButtons(soup, parser=parser) for soup in layouts ]
 
-def countAppTags(layoutsPaths: [pathlib.Path, ...], *, custom=True) -> dict:
-    '''Returns a combined tag frequency dictionary for all layouts in an
-    application's layouts directory.'''
-
-    # we'll get all the app's layouts as a list of soup
-    layouts = []
-    for l in layoutsPaths:
-        layouts.extend(appSoup(l))
+def combineCounts(counts: [dict, ...]) -> dict:
+    '''Returns a running total of several tag frequency dictionaries.'''
 
     alltags = dict()
-    for soup in layouts:
-
-        # we can get a dictionary of tags in each layout with countTags
-        # we'll make a running total of each in the "alltags" dictionary
-        newtags = countTags(soup, custom=custom)
+    for newtags in counts:
 
         # combine all dictionaries in all layouts
 
@@ -116,6 +138,61 @@ def countAppTags(layoutsPaths: [pathlib.Path, ...], *, custom=True) -> dict:
             newvalue = int(newtags.get(k, 0))
             alltags[k] = oldvalue + newvalue
 
+    return alltags
+
+def combineTags(layouts: ["soup", ...], *, custom=True, parser=None) -> dict:
+    '''Returns a combined tag frequency dictionary for a list of layouts.'''
+
+    # we can get a dictionary of tags in each layout with countTags
+    # we'll make a running total of each with combineCounts
+    return combineCounts( countTags(soup, custom=custom, parser=parser) for soup in layouts )
+
+def countBufferTags(buffers: [reader.LayoutBuffer, ...], *, custom=True, cache=None, parser=None) -> (dict, [("path", "reason"), ...]):
+    '''Returns a combined tag frequency dictionary for layout buffers, closing
+    each one, along with the layouts that couldn't be parsed and why. With a
+    dedup.LayoutCache, a layout whose bytes were already analyzed the same way
+    anywhere in the run isn't parsed again.'''
+
+    counts = []
+    skipped = []
+    for buf in buffers:
+        with buf:
+            if cache is not None:
+                key, result = cache.get(buf, (bool(custom), parser or parsers.DEFAULT))
+            else:
+                result = None
+
+            if result is None:
+                try:
+                    result = (countTags(bufferSoup(buf, parser=parser), custom=custom, parser=parser), None)
+                except reader.SkippedLayout as e:
+                    result = (None, e.reason)
+                if cache is not None:
+                    cache.put(key, buf, result)
+
+        tags, reason = result
+        if tags is None:
+            skipped.append((buf.path, reason))
+        else:
+            counts.append(tags)
+
+    return (combineCounts(counts), skipped)
+
+def countAppTags(layoutsPaths: [pathlib.Path, ...], *, custom=True, skipped=None, parser=None) -> dict:
+    '''Returns a combined tag frequency dictionary for all layouts in an
+    application's layouts directory. Layouts that couldn't be read are
+    appended to skipped as (path, reason) pairs, if given.'''
+
+    # we'll get all the app's layouts as a list of soup
+    layouts = []
+    for l in layoutsPaths:
+        soups, errors = appSoup(l, parser=parser)
+        layouts.extend(soups)
+        if skipped is not None:
+            skipped.extend(errors)
+
+    alltags = combineTags(layouts, custom=custom, parser=parser)
+
     # throw the package location in there and we're all done
     alltags["package"] = str(layoutsPaths[0])
 
@@ -125,44 +202,118 @@ def countLayouts(layoutsPath: pathlib.Path) -> int:
     '''Counts how many layouts are defined.'''
     return len([ f for f in layoutsPath.iterdir() if f.is_file() ])
 
-def layoutSoup(layoutPath: pathlib.Path) -> "soup":
-    '''Make soup from a single layout.'''
+def binarySoup(buf: reader.LayoutBuffer, *, parser=None) -> "soup":
+    '''Make soup from an Android binary XML layout. References are resolved
+    to their names through the APK's resource table when the layout came out
+    of an APK and the table can be read; otherwise they stay resource IDs.'''
+
+    table = None
+    if _inApk(buf.path):
+        import zipfile
+        try:
+            table = axml.apkResources(buf.path.root.filename)
+        except (OSError, zipfile.BadZipFile, axml.AxmlError, struct.error, IndexError):
+            # the layout's tags don't depend on the table, and skipping it
+            # here would skip every layout with the same bytes elsewhere
+            pass
+
+    try:
+        return parsers.get(parser).build(axml.events(buf.data, table))
+    except (axml.AxmlError, struct.error, IndexError) as e:
+        raise reader.SkippedLayout(buf.path, "bad binary XML ({})".format(e))
+
+def bufferSoup(buf: reader.LayoutBuffer, *, parser=None) -> "soup":
+    '''Make soup from a layout buffer. The raw bytes go straight to the
+    parser along with the sniffed encoding; nothing is decoded to str first.
+    With another parser than bs4, this gives that parser's document.'''
+
+    if buf.kind == "axml":
+        return binarySoup(buf, parser=parser)
+
+    p = parsers.get(parser)
+    doc = p.parse(buf)
+
+    # the parser gave up without complaining; don't count it as a layout
+    # with no tags
+    if p.isEmpty(doc):
+        raise reader.SkippedLayout(buf.path, "no elements ({})".format(buf.encoding))
 
-    with layoutPath.open('r') as f:
-        s = bs(f)
-    return s
+    return doc
 
-def appSoup(layoutsPath: pathlib.Path) -> ["soup", ...]:
-    '''Make soup from each layout in an application's layouts directory.'''
+def layoutSoup(layoutPath: pathlib.Path, *, parser=None) -> "soup":
+    '''Make soup from a single layout.'''
+
+    with reader.openLayout(layoutPath) as buf:
+        return bufferSoup(buf, parser=parser)
 
-    apps = [ f for f in layoutsPath.iterdir() if f.is_file() ]
+def buffersSoup(buffers: [reader.LayoutBuffer, ...], *, parser=None) -> (["soup", ...], [("path", "reason"), ...]):
+    '''Make soup from layout buffers, closing each one. Also returns the
+    layouts that couldn't be parsed and why.'''
 
     layouts = []
-    errors = 0
-    for f in apps:
+    skipped = []
+    for buf in buffers:
         try:
-            layouts.append(layoutSoup(f))
-        except UnicodeDecodeError:
-            errors += 1
+            with buf:
+                layouts.append(bufferSoup(buf, parser=parser))
+        except reader.SkippedLayout as e:
+            skipped.append((e.path, e.reason))
 
-    if errors != 0:
+    return (layouts, skipped)
 
-        if errors == 1:
-            plural = ''
-        else:
-            plural = 's'
+def openApp(layoutsPath: pathlib.Path, *, preload=False) -> ([reader.LayoutBuffer, ...], [("path", "reason"), ...]):
+    '''Open each layout in an application's layouts directory. Also returns
+    the layouts that couldn't be read and why.'''
 
-        print("\n{} Unicode decode error{} in {}".format(errors, plural, layoutsPath))
+    buffers = []
+    skipped = []
+    for f in layoutsPath.iterdir():
+        if not f.is_file():
+            continue
+        try:
+            buffers.append(reader.openLayout(f, preload=preload))
+        except reader.SkippedLayout as e:
+            skipped.append((e.path, e.reason))
 
-    return layouts
+    return (buffers, skipped)
 
-def readRatingStats(layoutsPath: pathlib.Path) -> (list, int):
-    '''Gets a rating count and an average rating. The average rating is
-    returned as element [0], and the star counts are returned as their
-    respective elements, 1 to and including 5.'''
+def appSoup(layoutsPath: pathlib.Path, *, parser=None) -> (["soup", ...], [("path", "reason"), ...]):
+    '''Make soup from each layout in an application's layouts directory.
+    Also returns the layouts that were skipped and why.'''
 
-    p = layoutsPath.resolve()
-    root = layoutsPath.parts[0]
+    buffers, skipped = openApp(layoutsPath)
+    layouts, errors = buffersSoup(buffers, parser=parser)
+    return (layouts, skipped + errors)
+
+def reportSkipped(skipped: [("path", "reason"), ...], log=print) -> None:
+    '''Lists every layout that couldn't be analyzed.'''
+
+    if len(skipped) == 0:
+        return
+
+    plural = '' if len(skipped) == 1 else 's'
+    log("Skipped {} layout{}:".format(len(skipped), plural))
+    for path, reason in skipped:
+        log("  {}: {}".format(path, reason))
+
+def _inApk(path) -> bool:
+    '''Checks whether a path points inside an APK. zipfile is only imported
+    once an APK is opened, so until then nothing can be.'''
+    zipfile = sys.modules.get("zipfile")
+    return zipfile is not None and isinstance(path, zipfile.Path)
+
+def _diskPath(path) -> pathlib.Path:
+    '''Gives the real directory a path lives in. For a path inside an APK,
+    that's the directory holding the APK.'''
+    if _inApk(path):
+        return pathlib.Path(path.root.filename).parent
+    return path
+
+def ratingFile(layoutsPath: pathlib.Path) -> pathlib.Path:
+    '''Finds the rating.json that applies to a layouts directory: the first
+    one in it or any folder above it.'''
+
+    p = _diskPath(layoutsPath).resolve()
 
     while "rating.json" not in [ f.name for f in p.iterdir() ]:
         parent = p.parent
@@ -170,7 +321,16 @@ def readRatingStats(layoutsPath: pathlib.Path) -> (list, int):
             raise FileNotFoundError
         p = parent
 
-    p = p / "rating.json"
+    return p / "rating.json"
+
+def readRatingStats(layoutsPath: pathlib.Path) -> (list, int):
+    '''Gets a rating count and an average rating. The average rating is
+    returned as element [0], and the star counts are returned as their
+    respective elements, 1 to and including 5.'''
+
+    p = ratingFile(layoutsPath)
+
+    import json
 
     with p.open('r') as f:
         return json.load(f)
@@ -188,6 +348,7 @@ def emptyStats() -> dict:
     return stats
 
 def calcStats(vector: list) -> dict:
+    import statistics
 
     statFns = {
         "mean": statistics.mean,
@@ -226,7 +387,7 @@ def readAndTrash(inFile: pathlib.Path) -> (set, [dict, ...]):
         raise OSError("Couldn't read from file. Delete it if it's empty.")
 
     try:
-        os.remove(outFile.as_posix())
+        os.remove(inFile.as_posix())
     except OSError as e:
         print("Error: {} - {}".format(e.filename, str(e)))
 
@@ -266,6 +427,431 @@ def writeStats(outFile: pathlib.Path, entries: [dict], *, zeros=False) -> None:
         w.writeheader()
         w.writerows(entries)
 
+def loadApp(pair: (["res/layout", ...], ["res/values", ...]), *, preload=True) -> dict:
+    '''Does all of the disk reading for one application, so that it can run
+    ahead of parsing: reads every layout into memory and finds the rating.
+    Without preload, layouts are only mapped, for when nothing runs ahead and
+    the parser reads them straight away.'''
+
+    layoutPaths, resourcesPaths = pair
+    badApks = []
+    layoutPaths = apkLayouts(layoutPaths, badApks)
+
+    app = {
+        "layoutPaths": layoutPaths,
+        "resourcesPaths": resourcesPaths,
+        "layouts": [],
+        "skipped": badApks,
+        "rating": None,
+    }
+
+    if len(layoutPaths) == 0:
+        return app
+
+    for p in layoutPaths:
+        buffers, skipped = openApp(p, preload=preload)
+        app["layouts"].extend(buffers)
+        app["skipped"].extend(skipped)
+
+    # it doesn't matter which layoutPath we use to find the rating since
+    # they're all looking for a parent anyway
+    app["rating"] = readRatingStats(layoutPaths[0])
+
+    return app
+
+def mergeStats(outFile: pathlib.Path, inFiles: [pathlib.Path, ...], *, zeros=False) -> None:
+    '''Combines CSVs into one, one row at a time, so it never holds more
+    than a row and the set of apps it has seen. Headers are unioned; rows for
+    an app that was already written are dropped. Apps are told apart by their
+    "app" column (see appName), or by package for rows without one.'''
+
+    inFiles = list(inFiles)
+
+    # add other entries if already in the file
+    if outFile.exists():
+        print("Appending data to current CSV file...")
+        inFiles.insert(0, outFile)
+
+    # first pass: just the headers
+    header = set()
+    for p in inFiles:
+        with p.open('r') as f:
+            header = header.union(next(csv.reader(f), []))
+
+    header = sorted(header)
+    restval = 0 if zeros else ''
+
+    # names aren't counts; a file without them leaves them blank
+    names = [ column for column in ("app", "package") if column in header ]
+
+    import hashlib
+
+    seen = set()
+    written = 0
+    duplicates = 0
+
+    # second pass: stream rows through
+    tmpFile = outFile.with_name(outFile.name + ".tmp")
+    with tmpFile.open('w') as out:
+        w = csv.DictWriter(out, header, restval=restval)
+        w.writeheader()
+
+        for p in inFiles:
+            with p.open('r') as f:
+                for row in csv.DictReader(f):
+                    for column in names:
+                        row.setdefault(column, '')
+                    package = row.get("app") or row.get("package")
+                    if package:
+                        digest = hashlib.blake2b(package.encode("utf-8"), digest_size=8).digest()
+                        if digest in seen:
+                            duplicates += 1
+                            continue
+                        seen.add(digest)
+                    w.writerow(row)
+                    written += 1
+
+    os.replace(tmpFile.as_posix(), outFile.as_posix())
+    print("Wrote {} entries, dropped {} duplicates.".format(written, duplicates))
+
+def _parseShard(shard: "K/N") -> (int, int):
+    '''Reads a shard as given on the command line.'''
+
+    try:
+        k, n = ( int(x) for x in shard.split('/') )
+    except ValueError:
+        raise ValueError("shard should look like K/N, not {}".format(shard))
+
+    if not 1 <= k <= n:
+        raise ValueError("shard {} is not between 1 and {}".format(k, n))
+
+    return (k, n)
+
+def appName(pair: (["res/layout", ...], ["res/values", ...]), root: pathlib.Path = None) -> str:
+    '''Names an application by where it is in root: the repository folder it
+    lives in, or the APK's path within the folder of APKs. The name doesn't
+    depend on how root was spelled or where it's mounted. Without root, or for
+    an application outside it, the full resolved path has to do.'''
+
+    layoutPaths, valuesPaths = pair
+    paths = list(layoutPaths) + list(valuesPaths)
+    if len(paths) == 0:
+        return ''
+
+    path = pathlib.Path(paths[0]).resolve()
+    if root is None:
+        return path.as_posix()
+
+    try:
+        relative = path.relative_to(pathlib.Path(root).resolve())
+    except ValueError:
+        return path.as_posix()
+
+    if path.suffix == ".apk":
+        return relative.as_posix()
+    return relative.parts[0]
+
+def inShard(pair: (["res/layout", ...], ["res/values", ...]), k: int, n: int, root: pathlib.Path = None) -> bool:
+    '''Decides whether an application belongs to shard k of n. The choice
+    only depends on the application's name within root (see appName), so
+    every machine agrees wherever the repository is.'''
+    import zlib
+    key = appName(pair, root).encode("utf-8")
+    return zlib.crc32(key) % n == k - 1
+
+def shardFile(outFile: pathlib.Path, k: int, n: int) -> pathlib.Path:
+    '''Names the partial output of shard k of n.'''
+    return outFile.with_name("{}.shard-{}-of-{}{}".format(outFile.stem, k, n, outFile.suffix))
+
+def queryIndex(indexPath: pathlib.Path, terms: [("tag", "minimum"), ...], *, fields=False, countOnly=False, out=sys.stdout) -> int:
+    '''Writes a CSV of the apps in a tag index that use every tag in terms at
+    least its minimum number of times, and gives how many there were.'''
+
+    import tagindex  # local
+
+    if not indexPath.exists():
+        raise FileNotFoundError(indexPath)
+
+    index = tagindex.TagIndex(indexPath)
+    try:
+        matches = index.query(terms)
+
+        if countOnly:
+            print(len(matches), file=out)
+            return len(matches)
+
+        rows = []
+        header = set()
+        for app, counts in matches:
+            package, appFields = index.app(app)
+            row = { "package": package }
+            row.update(( ("tag_" + tagindex.tagName(tag), count) for (tag, _), count in zip(terms, counts) ))
+            if fields:
+                row.update(appFields)
+                header = header.union(appFields)
+            rows.append(row)
+    finally:
+        index.close()
+
+    tagColumns = [ "tag_" + tagindex.tagName(tag) for tag, _ in terms ]
+    w = csv.DictWriter(out, ["package"] + tagColumns + sorted(header))
+    w.writeheader()
+    w.writerows(rows)
+    return len(rows)
+
+def appRow(app: dict, *, custom=True, cache=None, parser=None) -> (dict, [("path", "reason"), ...]):
+    '''Analyzes one application loaded by loadApp. Gives its CSV row, or None
+    if it has no layouts, and the layouts that couldn't be analyzed.'''
+
+    layoutPaths = app["layoutPaths"]
+    if len(layoutPaths) == 0:
+        return (None, list(app["skipped"]))
+
+    # get the number of individual layouts defined
+    layoutCount = { "layoutCount": len(app["layouts"]) + len(app["skipped"]) }
+    skipped = list(app["skipped"])
+
+    # independent variable stats
+    stats, errors = countBufferTags(app["layouts"], custom=custom, cache=cache, parser=parser)
+    skipped.extend(errors)
+    stats["package"] = str(layoutPaths[0])
+
+    # dependent variable (evaluative metric) stats were found by loadApp
+    return (dictCombine(stats, app["rating"], layoutCount), skipped)
+
+def discover(source, *, apks=False, progress: checkpoint.Checkpoint = None, log=lambda x: None) -> [(["res/layout", ...], ["res/values", ...]), ...]:
+    '''Lists the applications to analyze. source is a repository folder (or,
+    with apks, a folder of APKs), a DIRLIST pickled by the command line, or
+    a list of (layouts, values) pairs already. Progress goes to log.'''
+
+    if not isinstance(source, (str, pathlib.PurePath)):
+        return list(source)
+
+    source = pathlib.Path(source)
+    if source.is_file():
+        import pickle
+        with source.open('rb') as f:
+            return pickle.load(f)
+    if apks:
+        return _getApkDirs(source, log=log, status=log)
+    return _getRepoDirs(source, progress, log=log, status=log)
+
+def analyzeApps(dirs: [(["res/layout", ...], ["res/values", ...]), ...], *, custom=True,
+        prefetch=2, readers=1, progress: checkpoint.Checkpoint = None, cache=None,
+        times=None, skipped=None, parser=None, root=None, log=lambda x: None):
+    '''Yields the CSV row of each application in dirs, in order, as soon as it
+    has been analyzed. Nothing is kept after a row is yielded, so memory
+    doesn't grow with the number of applications.
+
+    Reading runs prefetch applications ahead on readers threads. Apps whose
+    rows are already in progress (a checkpoint.Checkpoint) are yielded from
+    there instead of being analyzed again, and new rows are recorded in it.
+    cache is a dedup.LayoutCache and times a pipeline.StageTimes to share
+    across calls, even calls with different custom or parser settings. Layouts that couldn't be analyzed are appended to skipped
+    as (path, reason) pairs, if given. parser names the XML parser to count
+    tags with (see parsers.py). With root, the folder dirs were found in,
+    each row gets an "app" column naming the app (see appName).'''
+
+    import pipeline  # local
+
+    if progress is None:
+        progress = checkpoint.Checkpoint()
+
+    # folders without layouts or values have nothing to show, and no name
+    # to record them by
+    dirs = [ pair for pair in dirs if any(pair) ]
+    keys = [ appName(pair, root) for pair in dirs ]
+    done = [ progress.isDone(k) for k in keys ]
+    pending = [ pair for pair, d in zip(dirs, done) if not d ]
+
+    # reading ahead needs whole files in memory; reading inline can map them
+    load = functools.partial(loadApp, preload=prefetch > 0)
+    apps = pipeline.prefetch(pending, load, depth=prefetch, workers=readers, times=times)
+    try:
+        for i, key in enumerate(keys):
+            log("{:3}%".format(i * 100 // len(keys)))
+
+            if done[i]:
+                row, appSkipped = progress.popApp(key)
+            else:
+                _, app = next(apps)
+                row, appSkipped = appRow(app, custom=custom, cache=cache, parser=parser)
+                if row is not None and root is not None:
+                    row["app"] = appName(dirs[i], root)
+                progress.recordApp(key, row, appSkipped)
+
+            if skipped is not None:
+                skipped.extend(appSkipped)
+            if row is not None:
+                yield row
+    finally:
+        apps.close()
+
+def analyzeRepository(source, *, apks=False, **kwargs):
+    '''Yields the CSV row of each application in source, which is anything
+    discover takes. Keyword arguments are passed on to analyzeApps.'''
+    if isinstance(source, (str, pathlib.PurePath)) and pathlib.Path(source).is_dir():
+        kwargs.setdefault("root", pathlib.Path(source))
+    dirs = discover(source, apks=apks, progress=kwargs.get("progress"), log=kwargs.get("log", lambda x: None))
+    yield from analyzeApps(dirs, **kwargs)
+
+def appFiles(pair: (["res/layout", ...], ["res/values", ...])) -> [pathlib.Path, ...]:
+    '''Lists the files an application's row is made from: its layouts (or
+    its APK) and its rating file.'''
+
+    layoutPaths, _ = pair
+    files = []
+    for p in layoutPaths:
+        if p.suffix == ".apk":
+            files.append(p)
+            continue
+        try:
+            files.extend(sorted( f for f in p.iterdir() if f.is_file() ))
+        except OSError:
+            continue
+
+    if len(layoutPaths) > 0:
+        # an APK's rating is found from the folder it's in, as for the
+        # layouts inside it (see _diskPath)
+        first = layoutPaths[0]
+        if first.suffix == ".apk":
+            first = first.parent
+        try:
+            files.append(ratingFile(first))
+        except OSError:
+            pass
+
+    return files
+
+DELTA_HEADER = ["package", "change", "column", "old", "new"]
+
+def rowDelta(old: dict, new: dict, *, zeros=True) -> [dict, ...]:
+    '''Lists what changed between two rows of an application, one line per
+    column, in column order. Either row may be None, for an application that
+    was added or removed. With zeros, a missing value counts as 0.'''
+
+    if old is None and new is None:
+        return []
+
+    change = "changed"
+    if old is None:
+        change, old = "added", dict()
+    elif new is None:
+        change, new = "removed", dict()
+
+    package = new.get("package", old.get("package"))
+    missing = 0 if zeros else ''
+
+    # the side that doesn't exist has no values at all
+    missingOld = '' if change == "added" else missing
+    missingNew = '' if change == "removed" else missing
+
+    delta = []
+    for column in sorted(set(old).union(new) - {"package"}):
+        before = old.get(column, missingOld)
+        after = new.get(column, missingNew)
+        if before != after:
+            delta.append({ "package": package, "change": change, "column": column, "old": before, "new": after })
+
+    # an app that came or went with nothing to show still came or went
+    if not delta and change != "changed":
+        delta.append({ "package": package, "change": change, "column": '', "old": '', "new": '' })
+
+    return delta
+
+def diffApps(dirs: [(["res/layout", ...], ["res/values", ...]), ...], snap: "snapshot.Snapshot", *,
+        custom=True, zeros=True, prefetch=2, readers=1, cache=None, times=None, skipped=None,
+        parser=None, root=None, counts=None, log=lambda x: None):
+    '''Yields what changed in each application since snap was taken, as
+    rowDelta lines. Applications are known by their name within root (see
+    appName). Only applications whose directories or files (see appFiles)
+    changed are analyzed again; applications no longer in dirs are reported
+    removed. snap is brought up to date but not committed. counts, if given, is a dict
+    that's filled in with how many apps were added, changed, removed and
+    unchanged. Other keyword arguments are as for analyzeApps.'''
+
+    import pipeline  # local
+    import snapshot  # local
+
+    if counts is None:
+        counts = dict()
+    for k in ("added", "changed", "removed", "unchanged"):
+        counts[k] = 0
+
+    # rows made with other settings can't be compared with new ones
+    settings = { "version": VERSION, "custom": bool(custom) }
+    if snap.settings() != settings:
+        for key in snap.keys():
+            appDirs, _, row = snap.get(key)
+            snap.put(key, appDirs, dict(), row)
+        snap.setSettings(settings)
+
+    dirs = list(dirs)
+    keys = [ appName(pair, root) for pair in dirs ]
+
+    # stat everything first; only changed apps are read
+    pending = []
+    for i, (key, pair) in enumerate(zip(keys, dirs)):
+        log("{:3}% checked".format(i * 100 // len(keys)))
+        stored = snap.get(key)
+        oldDirs, oldFiles, oldRow = stored if stored is not None else (None, None, None)
+        appDirs = [ sorted( str(p) for p in paths ) for paths in pair ]
+        files, changed = snapshot.examine(appFiles(pair), oldFiles)
+        if changed or appDirs != oldDirs or stored is None:
+            pending.append((key, pair, appDirs, files, oldRow, stored is None))
+        else:
+            counts["unchanged"] += 1
+            if files != oldFiles:
+                # touched, but the same bytes; remember the new times
+                snap.put(key, appDirs, files, oldRow)
+
+    load = functools.partial(loadApp, preload=prefetch > 0)
+    apps = pipeline.prefetch([ pair for _, pair, _, _, _, _ in pending ], load,
+            depth=prefetch, workers=readers, times=times)
+    try:
+        for i, (key, pair, appDirs, files, oldRow, added) in enumerate(pending):
+            log("{:3}% analyzed".format(i * 100 // len(pending)))
+            _, app = next(apps)
+            row, appSkipped = appRow(app, custom=custom, cache=cache, parser=parser)
+            if skipped is not None:
+                skipped.extend(appSkipped)
+
+            counts["added" if added else "changed"] += 1
+            snap.put(key, appDirs, files, row)
+            yield from rowDelta(oldRow, row, zeros=zeros)
+    finally:
+        apps.close()
+
+    for key in sorted(snap.keys() - set(keys)):
+        _, _, oldRow = snap.get(key)
+        counts["removed"] += 1
+        snap.forget(key)
+        yield from rowDelta(oldRow, None, zeros=zeros)
+
+def writeDelta(outFile: pathlib.Path, deltas) -> int:
+    '''Writes rowDelta lines to a CSV, replacing it whole once every line is
+    written. Gives the number of lines.'''
+
+    tmpFile = outFile.with_name(outFile.name + ".tmp")
+    lines = 0
+    with tmpFile.open('w') as out:
+        w = csv.DictWriter(out, DELTA_HEADER)
+        w.writeheader()
+        for line in deltas:
+            w.writerow(line)
+            lines += 1
+
+    os.replace(tmpFile.as_posix(), outFile.as_posix())
+    return lines
+
+def writeRows(rows, sink) -> int:
+    '''Sends each row to a sink (see sinks.py), closes it, and gives the
+    number of rows written.'''
+    with sink:
+        for row in rows:
+            sink.write(row)
+    return sink.count
+
 def _die(f, code=0):
     '''Closes open files and quits.'''
     if f is not None:
@@ -284,33 +870,88 @@ def _getArgDirs(args, log=lambda x: None) -> ("res/layouts", "res/values"):
         resourcesPath = pathlib.Path(args["VALUES"])
     return (layoutPath, resourcesPath)
 
-def _getRepoDirs(repoDir: "repo path") -> [(["res/layout", ...], ["res/values", ...]), ...]:
-    repos = []
-    print("Finding applications in repository...")
-    for i, repo in enumerate(repoDir.iterdir()):
-        echo("{:4} found: {}".format(i, repo))
-        repos.append(repo)
-    print()
-
-    paths = []
+def _getRepoDirs(repoDir: "repo path", progress: checkpoint.Checkpoint = None, *,
+        log=print, status=echo) -> [(["res/layout", ...], ["res/values", ...]), ...]:
+    '''Finds the layouts and values of each application in a repository.
+    Each application's result is recorded in progress as it's found, and
+    applications that progress already knows about aren't searched again.
+    Messages go to log, and the running count to status.'''
+
+    if progress is None:
+        progress = checkpoint.Checkpoint()
+
+    if progress.repos is None:
+        repos = []
+        log("Finding applications in repository...")
+        for i, repo in enumerate(repoDir.iterdir()):
+            status("{:4} found: {}".format(i, repo))
+            repos.append(repo)
+        log('')
+        progress.recordRepos(repos)
+    else:
+        repos = progress.repos
+        log("Resuming with {} applications in repository.".format(len(repos)))
 
     repo_count = len(repos)
 
-    print("Finding application layouts...")
+    log("Finding application layouts...")
     for i, repo in enumerate(repos):
-        echo("{:3}% {}".format(i * 100 // repo_count, repo))
+        if progress.isFound(repo):
+            continue
+
+        status("{:3}% {}".format(i * 100 // repo_count, repo))
         try:
             layouts = list(repo.glob("**/res/layout"))
             values = list(repo.glob("**/res/values"))
         except OSError as e:
-            print("\nBroken app!", e.filename, str(e) + '\n')
+            log("\nBroken app! {} {}\n".format(e.filename, e))
+            progress.recordFound(repo, None)
             continue
 
         layouts = [ l for l in layouts if ".hg" not in l.parts ]
         values = [ l for l in values if ".hg" not in l.parts ]
-        paths.append((layouts, values))
+        progress.recordFound(repo, (layouts, values))
+
+    log('')
+
+    found = ( progress.found[str(repo)] for repo in repos )
+    return [ pair for pair in found if pair is not None ]
+
+def _getApkDirs(apkDir: "folder of APKs", *, log=print, status=echo) -> [(["app.apk"], ["app.apk"]), ...]:
+    '''Finds APKs to analyze. Their layouts are found with apkLayouts at
+    analysis time, so the result can be pickled to DIRLIST. An APK is its
+    own values too: android.AppResources reads its resources.arsc.'''
+    log("Finding APKs in folder...")
+    paths = []
+    for i, apk in enumerate(sorted(apkDir.glob("**/*.apk"))):
+        status("{:4} found: {}".format(i, apk))
+        paths.append(([apk], [apk]))
+    log('')
+    return paths
+
+def apkLayouts(layoutPaths: [pathlib.Path, ...], skipped=None) -> [pathlib.Path, ...]:
+    '''Swaps any APK in a list of layout directories for the res/layout*
+    directories inside it. Nothing is extracted to disk. APKs that can't be
+    opened are appended to skipped as (path, reason) pairs, if given.'''
+
+    paths = []
+    for p in layoutPaths:
+        if p.suffix != ".apk":
+            paths.append(p)
+            continue
+
+        import zipfile
+
+        try:
+            res = zipfile.Path(str(p), "res/")
+            paths.extend(sorted(
+                ( d for d in res.iterdir() if d.is_dir() and d.name.startswith("layout") ),
+                key=lambda d: d.name,
+            ))
+        except (OSError, zipfile.BadZipFile) as e:
+            if skipped is not None:
+                skipped.append((p, "bad APK ({})".format(e)))
 
-    print()
     return paths
 
 def _getLogFn(args) -> ("function", "file"):
@@ -324,8 +965,11 @@ def _getLogFn(args) -> ("function", "file"):
     else:
         return (lambda x: None, None)
 
-if __name__ == "__main__":
-    args = docopt(__doc__, version=VERSION)
+def main(argv=None) -> None:
+    '''The command-line interface.'''
+
+    from docopt import docopt
+    args = docopt(__doc__, argv=argv, version=VERSION)
 
     if args["--dirlist"]:
         import pickle
@@ -333,6 +977,52 @@ if __name__ == "__main__":
     # How do we want to log?
     log, f = _getLogFn(args)
 
+    # Are we combining the output of sharded runs?
+    if args["merge"]:
+        print("Merging {} files...".format(len(args["PARTIALS"])))
+        partials = [ pathlib.Path(p) for p in args["PARTIALS"] ]
+        mergeStats(pathlib.Path(args["CSV"]), partials, zeros=not args["--blanks"])
+        print("Done.")
+        _die(f)
+
+    # Are we asking questions of a finished run?
+    if args["query"]:
+        import tagindex  # local
+        terms = [ tagindex.parseTerm(t, int(args["--min"])) for t in args["TAGS"] ]
+        queryIndex(pathlib.Path(args["INDEX"]), terms, fields=args["--fields"], countOnly=args["--count"])
+        _die(f)
+
+    # Which parser are we counting with? Find out now rather than after discovery.
+    parsers.get(args["--parser"])
+
+    # Are we keeping track of progress?
+    if args["--resume"] and not args["--checkpoint"]:
+        print("--resume needs the --checkpoint FILE to resume from.")
+        _die(f, 2)
+    if args["--checkpoint"]:
+        # everything that changes which rows the run makes, or what's in them
+        settings = {
+            "version": VERSION,
+            "custom": args["--custom"],
+            "parser": args["--parser"],
+            "shard": args["--shard"],
+        }
+        try:
+            progress = checkpoint.Checkpoint(pathlib.Path(args["--checkpoint"]),
+                    resume=args["--resume"], settings=settings)
+        except ValueError as e:
+            print(e)
+            _die(f, 2)
+    else:
+        progress = checkpoint.Checkpoint()
+
+    # apps are named relative to the folder they were found in
+    root = None
+    if args["--repo"]:
+        root = pathlib.Path(args["REPOSITORY"])
+    elif args["--apks"]:
+        root = pathlib.Path(args["APKS"])
+
     if args["--dirlist"] and not args["--cache"]:
         print("Using application layouts in", args["DIRLIST"] + ".")
         with open(args["DIRLIST"], 'rb') as f:
@@ -340,7 +1030,9 @@ if __name__ == "__main__":
     else:
         # How are we getting our data?
         if args["--repo"]:
-            dirs = _getRepoDirs(pathlib.Path(args["REPOSITORY"]))
+            dirs = _getRepoDirs(pathlib.Path(args["REPOSITORY"]), progress)
+        elif args["--apks"]:
+            dirs = _getApkDirs(pathlib.Path(args["APKS"]))
         else:
             print("Finding application layouts...")
             dirs = [_getArgDirs(args, log=log)]
@@ -351,52 +1043,95 @@ if __name__ == "__main__":
             pickle.dump(dirs, f)
         print("100%", str(pathlib.Path(args["DIRLIST"])))
 
+    # Are we only looking at what changed since last time?
+    if args["diff"]:
+        import pipeline  # local
+        import snapshot  # local
+
+        snap = snapshot.Snapshot(pathlib.Path(args["STATE"]))
+        layoutCache = dedup.LayoutCache()
+        times = pipeline.StageTimes()
+        skipped = []
+        counts = dict()
+
+        print("Checking {} applications for changes...".format(len(dirs)))
+        deltas = diffApps(dirs, snap, custom=args["--custom"], zeros=not args["--blanks"],
+                prefetch=int(args["--prefetch"]), readers=int(args["--readers"]),
+                cache=layoutCache, times=times, skipped=skipped, parser=args["--parser"],
+                root=root, counts=counts, log=echo)
+        lines = writeDelta(pathlib.Path(args["CSV"]), deltas)
+
+        # only now that the delta is safely written is the state moved on
+        snap.commit()
+        snap.close()
+
+        print()
+        reportSkipped(skipped)
+        print("{added} added, {changed} changed, {removed} removed, {unchanged} unchanged.".format(**counts))
+        print("Wrote {} changed values to {}.".format(lines, args["CSV"]))
+        _die(f)
+
+    # Are we only doing part of the job?
+    if args["--shard"]:
+        k, n = _parseShard(args["--shard"])
+        dirs = [ pair for pair in dirs if inShard(pair, k, n, root) ]
+        print("Shard {} of {} has {} applications.".format(k, n, len(dirs)))
+
+    dirs = [ pair for pair in dirs if any(pair) ]
     allDirs = len(dirs)
 
-    # start a list of dicts, which represent CSV rows, which represent apps
-    entries = []
-    print("Analyzing application layout tags...")
-    for i, pair in enumerate(dirs):
-        layoutPaths, resourcesPaths = pair
-        echo("{:3}%".format(i * 100 // allDirs))
-
-        if len(layoutPaths) == 0:
-            continue
-
-        # get the number of individual layouts defined
-        layoutCount = (countLayouts(p) for p in layoutPaths)
-        if layoutCount == 0:
-            continue
-        layoutCount = { "layoutCount": sum(layoutCount) }
+    # apps already recorded by an earlier, interrupted run are done
+    done = sum(( progress.isDone(appName(pair, root)) for pair in dirs ))
+    if done:
+        print("Resuming with {} of {} applications analyzed.".format(done, allDirs))
 
-        # Where are our independent variable stats coming from?
-        if args["tags"]:
-            stats = countAppTags(layoutPaths, custom=args["--custom"])
+    import pipeline  # local
+    import sinks  # local
 
-        # calculate dependent variable (evaluative metric) stats. it doesn't
-        # matter which layoutPath we use to find the rating since they're all
-        # looking for a parent anyway
-        try:
-            ratingStats = readRatingStats(layoutPaths[0])
-        except IndexError:
-            try:
-                ratingStats = readRatingStats(resourcePaths[0])
-            except IndexError:
-                print("Can't get rating!")
-                continue
-
-        entries.append(dictCombine(stats, ratingStats, layoutCount))
-
-    print()
+    # byte-identical layouts in different apps are only analyzed once
+    layoutCache = dedup.LayoutCache()
+    times = pipeline.StageTimes()
+    skipped = []
 
     # Where are our stats going?
     outFile = pathlib.Path(args["CSV"])
+    if args["--shard"]:
+        outFile = shardFile(outFile, k, n)
 
     # Do we want zeros or blanks in our output file?
     zeros = not args["--blanks"]
+    sink = sinks.CSVSink(outFile, zeros=zeros, log=print)
 
-    print("Writing {} entries to file...".format(len(entries)))
-    writeStats(outFile, entries, zeros=zeros)
+    # Are we indexing tags as we go?
+    index = None
+    if args["--index"]:
+        import tagindex  # local
+        index = tagindex.TagIndex(pathlib.Path(args["--index"]))
+
+    print("Analyzing application layout tags...")
+    rows = analyzeApps(dirs, custom=args["--custom"], prefetch=int(args["--prefetch"]),
+            readers=int(args["--readers"]), progress=progress, cache=layoutCache,
+            times=times, skipped=skipped, parser=args["--parser"], root=root, log=echo)
+    for row in rows:
+        sink.write(row)
+        if index is not None:
+            index.add(row)
+
+    if index is not None:
+        index.close()
+
+    print()
+    reportSkipped(skipped)
+    layoutCache.report()
+    times.report()
+
+    print("Writing {} entries to file...".format(sink.count))
+    sink.close()
     print("Done. Closing open files...")
+    progress.close()
     _die(f)
     print("Done.")
+
+
+if __name__ == "__main__":
+    main()
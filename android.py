@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 # this file is okay to import * into devices.py
 
-from bs4 import BeautifulSoup
-import pygame.font as fonts
+# bs4 and pygame are imported where they're used; pygame starts up SDL, and
+# neither is needed just to import this module.
 from functools import lru_cache as memoize
 import pathlib
-bs = lambda x: BeautifulSoup(x, "xml")
+
+import axml  # local
+import parsers  # local
 
 
 class AndroidDevice:
@@ -76,6 +78,7 @@ class AndroidDevice:
         # FUTURE: factor in weight
 
         print("Calculating...")  # DEBUG
+        import pygame.font as fonts
         fonts.init()
         font = fonts.SysFont(fontFamily, size)
 
@@ -138,6 +141,10 @@ class Dip(int):
     def fromAndroid(cls, s: str) -> "Dip":
         '''Generates a Dip value from an Android XML property.'''
 
+        # already measured, e.g. by wrappable
+        if isinstance(s, (int, float)):
+            return cls(round(s))
+
         s = s.replace(' ', '')
 
         new = lambda x: cls.__new__(cls, x)
@@ -169,6 +176,175 @@ class Dip(int):
         return fn(num)
 
 
+class AppResources:
+
+    '''An application's res/values, read once. Flat values are kept by
+    "type/name"; styles are flattened through their parents the first time
+    they're asked for, and remembered. Files are read with the named parser
+    (see parsers.py). An APK among the paths gives the simple values in its
+    resources.arsc; its styles are compiled into bags that aren't decoded.'''
+
+    # how many references to follow before giving up on a value
+    MAX_HOPS = 8
+
+    def __init__(self, resourcesPaths: [pathlib.Path], parser=None):
+        self.parser = parsers.get(parser)
+        self.values = dict()  # "type/name" -> value
+        self.styles = dict()  # style name -> (parent or None, { item: value })
+        self.flat = dict()  # style name -> { item: value }, through parents
+        self.theme = None  # style name of the application theme
+
+        # earlier directories win, as they do in resource lookups
+        for resourcesPath in resourcesPaths:
+            if resourcesPath.suffix == ".apk":
+                self._readApk(resourcesPath)
+                continue
+            for filename in sorted(resourcesPath.glob("*.xml")):
+                try:
+                    with filename.open('rb') as f:
+                        entries = self.parser.resources(f)
+                except OSError:
+                    print("Couldn't read {}.".format(filename))
+                    continue
+                self._read(entries)
+
+        self.theme = self._findTheme(resourcesPaths)
+
+    def _read(self, entries: [("kind", {"attr": "value"}, "string", [("kind", {}, "string"), ...]), ...]):
+        for kind, attrs, string, children in entries:
+            name = attrs.get("name")
+            if name is None:
+                continue
+
+            if kind == "style":
+                items = { itemAttrs["name"]: (itemString or '').strip()
+                        for itemKind, itemAttrs, itemString in children
+                        if itemKind == "item" and "name" in itemAttrs }
+                self.styles.setdefault(name, (self._parentOf(name, attrs.get("parent")), items))
+            elif kind == "item" and "type" in attrs:
+                self.values.setdefault("{}/{}".format(attrs["type"], name), string)
+            elif string is not None:
+                self.values.setdefault("{}/{}".format(kind, name), string.strip())
+
+    def _readApk(self, apkPath: pathlib.Path):
+        import struct
+        import zipfile
+        try:
+            table = axml.apkResources(str(apkPath))
+        except (OSError, zipfile.BadZipFile, axml.AxmlError, struct.error) as e:
+            print("Couldn't read resources of {}: {}".format(apkPath, e))
+            return
+        if table is None:
+            return
+        for name in table.values:
+            self.values.setdefault(name, table.value(name))
+
+    @staticmethod
+    def _parentOf(name: str, parent: str) -> str:
+        '''An explicit parent wins (and parent="" means none); otherwise a
+        dotted name inherits from the name before its last dot.'''
+
+        if parent is None:
+            return name.rpartition('.')[0] or None
+        if parent == '':
+            return None
+        # framework styles keep their prefix; they're never found, so the
+        # chain stops there
+        if parent.startswith("@android:style/"):
+            return "android:" + parent[len("@android:style/"):]
+        for prefix in ("@style/", "style/"):
+            if parent.startswith(prefix):
+                return parent[len(prefix):]
+        return parent
+
+    def _findTheme(self, resourcesPaths: [pathlib.Path]) -> str:
+        '''Reads the application theme out of the manifest next to res/.'''
+
+        for resourcesPath in resourcesPaths:
+            manifest = resourcesPath.parent.parent / "AndroidManifest.xml"
+            try:
+                with manifest.open('rb') as f:
+                    application = self.parser.attributes(f, "application")
+            except OSError:
+                continue
+            if application is not None and application.get("android:theme"):
+                return self._parentOf('', application["android:theme"])
+        return None
+
+    def style(self, name: str) -> dict:
+        '''Gives every item a style sets, its own and its parents'. Each style
+        is only flattened once.'''
+
+        flat = self.flat.get(name)
+        if flat is not None:
+            return flat
+
+        # mark it first, so a parent cycle ends here instead of recursing
+        self.flat[name] = dict()
+
+        parent, items = self.styles.get(name, (None, dict()))
+        flat = dict(self.style(parent)) if parent is not None else dict()
+        flat.update(items)
+
+        self.flat[name] = flat
+        return flat
+
+    def resolve(self, value: str, theme: str = None) -> str:
+        '''Follows "@type/name" references and "?attr" theme attributes until
+        there's a plain value, or until one can't be found.'''
+
+        theme = theme or self.theme
+        for _ in range(self.MAX_HOPS):
+            if value is None or len(value) < 2:
+                return value
+
+            if value[0] == '?':
+                attr = value[1:].replace("attr/", '', 1)
+                if theme is None or attr not in self.style(theme):
+                    return value
+                value = self.style(theme)[attr]
+
+            elif value[0] == '@' and not value.startswith(("@+", "@android:", "@id/", "@style/")):
+                found = self.values.get(value[1:])
+                if found is None:
+                    return value
+                value = found
+
+            else:
+                return value
+
+        return value
+
+    def attributes(self, soup) -> dict:
+        '''Gives an element's attributes as Android sees them: its style's
+        items under its own attributes, with references resolved.'''
+
+        attrs = dict()
+
+        style = soup.get("style")
+        if style is not None:
+            attrs.update(self.style(self._parentOf('', style)))
+
+        attrs.update(soup.attrs)
+        return { k: self.resolve(v) if isinstance(v, str) else v for k, v in attrs.items() }
+
+
+@memoize(maxsize=32)
+def _appResources(resourcesPaths: (pathlib.Path, ...), parser: str) -> AppResources:
+    return AppResources(resourcesPaths, parser)
+
+def appResources(resourcesPaths: [pathlib.Path], parser=None) -> AppResources:
+    '''Gives the AppResources for an application's res/values directories,
+    reading them only the first time.'''
+    return _appResources(tuple(resourcesPaths or ()), parser or parsers.DEFAULT)
+
+
+def attributes(soup, resourcesPaths: [pathlib.Path]) -> dict:
+    '''Gives an element's attributes with styles, theme attributes, and
+    resource references resolved.'''
+    return appResources(resourcesPaths).attributes(soup)
+
+
 def resource(value: str, resourcesPaths: [pathlib.Path]):
     '''Finds the value of a property in an external resources file if a
     reference to it exists.
@@ -181,32 +357,7 @@ def resource(value: str, resourcesPaths: [pathlib.Path]):
     # be stripped production and should be considered DEBUG.
     assert not value.startswith("@+id")
 
-    if not value.startswith("@+"):
-        return value
-
-    value.replace("@+", '', 1)
-    filename, key = tuple(value.split('/', 1))
-
-    l = len(resourcesPaths)
-    for i, resourcesPath in enumerate(resourcesPaths):
-        remaining = l - i - 1
-        try:
-            filename = resourcesPath / (filename + ".xml")
-            with filename.open('r') as f:
-                rsoup = bs(f).find("resources")
-        except OSError:
-            m = "Couldn't find {}."
-            m += "Will try the next of {} remaining directories."
-            m = m.format(filename, remaining)
-            print(m)
-
-        if rsoup is None:
-            m = "Couldn't find {} in {}."
-            m += "Will try the next of {} remaining directories."
-            m = m.format(value, filename, remaining)
-            print(m)
-
-    return rsoup.find(name=key).string
+    return appResources(resourcesPaths).resolve(value)
 
 
 def inheritProperty(value, parent, getFn):
@@ -221,6 +372,18 @@ def inheritProperty(value, parent, getFn):
         raise AttributeError("value is unique, not inheritProperty")
 
 
+def textStyle(attrs: dict) -> dict:
+    '''Picks the keyword arguments for AndroidDevice.textDimensions out of
+    resolved attributes.'''
+
+    style = dict()
+    if "android:textSize" in attrs:
+        style["size"] = attrs["android:textSize"]
+    if "android:typeface" in attrs:
+        style["font"] = attrs["android:typeface"]
+    return style
+
+
 def wrappable(width: str, height: str, text: str, device: AndroidDevice, **kwargs) -> (str, str):
     '''Handles automatic "resize to fit text" on Buttons and the like.
     If not applicable, just pipes the value on through.'''
@@ -335,10 +498,11 @@ class LinearLayout(AndroidLayout):
         '''Initializes a new LinearLayout from a bs4 soup object.'''
 
         new = cls()
+        attrs = attributes(soup, resourcesPaths)
 
-        new.id = soup.get("android:id", None)
-        new.height = soup("android:layout_height", None)
-        new.width = soup("android:layout_width", None)
+        new.id = attrs.get("android:id", None)
+        new.height = attrs.get("android:layout_height", None)
+        new.width = attrs.get("android:layout_width", None)
 
         new.parent = parent
 
@@ -440,13 +604,14 @@ class UnknownObject(AndroidObject):
         know anything about.'''
 
         new = cls()
+        attrs = attributes(soup, resourcesPaths)
 
-        width = soup["android:layout_width"]
-        height = soup["android:layout_height"]
+        width = attrs["android:layout_width"]
+        height = attrs["android:layout_height"]
 
         try:
-            text = soup["android:text"]
-            wrappable(width, height, text, device)
+            text = attrs["android:text"]
+            wrappable(width, height, text, device, **textStyle(attrs))
         except KeyError:
             # no text in soup
             print(width, height)
@@ -479,16 +644,16 @@ class Button(AndroidObject):
         '''Initializes a new Button from a bs4 soup object.'''
 
         new = cls()
+        attrs = attributes(soup, resourcesPaths)
 
-        new.id = soup["android:id"]
+        new.id = attrs["android:id"]
 
-        new.text = resource(soup.get("android:text", None), resourcesPath)
+        new.text = attrs.get("android:text", None)
 
-        width = soup["android:layout_width"]
-        height = soup["android:layout_height"]
+        width = attrs["android:layout_width"]
+        height = attrs["android:layout_height"]
 
-        # FUTURE: implement fonts
-        width, height = wrappable(width, height, new.text, device)
+        width, height = wrappable(width, height, new.text, device, **textStyle(attrs))
 
         try:
             new.width = inheritProperty(width, parent, lambda x: x.width)
@@ -500,7 +665,7 @@ class Button(AndroidObject):
         except AttributeError:
             new.height = Dip.fromAndroid(height)
 
-        gravity = soup.get("android:layout_gravity", "match_parent")
+        gravity = attrs.get("android:layout_gravity", "match_parent")
         try:
             new.gravity = inheritProperty(width, parent, lambda x: x.childGravity)
         except AttributeError:
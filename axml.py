@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+'''Decodes Android binary XML (AXML), the compiled form of res/layout files
+inside an APK, and the resources.arsc table its references point into. Pure
+Python; works on any bytes-like buffer.'''
+
+import struct
+from functools import lru_cache as memoize
+
+# chunk types, from frameworks/base/libs/androidfw/include/androidfw/ResourceTypes.h
+RES_STRING_POOL_TYPE = 0x0001
+RES_TABLE_TYPE = 0x0002
+RES_XML_TYPE = 0x0003
+RES_XML_START_NAMESPACE_TYPE = 0x0100
+RES_XML_END_NAMESPACE_TYPE = 0x0101
+RES_XML_START_ELEMENT_TYPE = 0x0102
+RES_XML_END_ELEMENT_TYPE = 0x0103
+RES_XML_CDATA_TYPE = 0x0104
+RES_TABLE_PACKAGE_TYPE = 0x0200
+RES_TABLE_TYPE_TYPE = 0x0201
+
+# string pool flags
+UTF8_FLAG = 1 << 8
+
+# table type flags
+FLAG_SPARSE = 0x01
+FLAG_OFFSET16 = 0x02
+
+# table entry flags
+FLAG_COMPLEX = 0x0001
+FLAG_COMPACT = 0x0008
+
+NO_ENTRY = 0xffffffff
+NO_INDEX = 0xffffffff
+
+# Res_value data types
+TYPE_NULL = 0x00
+TYPE_REFERENCE = 0x01
+TYPE_ATTRIBUTE = 0x02
+TYPE_STRING = 0x03
+TYPE_FLOAT = 0x04
+TYPE_DIMENSION = 0x05
+TYPE_FRACTION = 0x06
+TYPE_DYNAMIC_REFERENCE = 0x07
+TYPE_INT_DEC = 0x10
+TYPE_INT_HEX = 0x11
+TYPE_INT_BOOLEAN = 0x12
+TYPE_FIRST_COLOR_INT = 0x1c
+TYPE_LAST_COLOR_INT = 0x1f
+
+DIMENSION_UNITS = ("px", "dp", "sp", "pt", "in", "mm")
+FRACTION_UNITS = ("%", "%p")
+RADIX_MULTS = (1 / (1 << 8), 1 / (1 << 15), 1 / (1 << 23), 1 / (1 << 31))
+
+# Compiled layouts store these enums as integers; put the source spelling back
+# so layouts from APKs look like layouts from sources.
+SIZES = { -1: "match_parent", -2: "wrap_content" }
+ENUMS = {
+    "layout_width": SIZES,
+    "layout_height": SIZES,
+    "orientation": { 0: "horizontal", 1: "vertical" },
+}
+
+chunkHeader = struct.Struct("<HHI")
+
+
+class AxmlError(ValueError):
+
+    '''Raised when a buffer isn't well-formed binary XML or resource table.'''
+
+
+def _chunk(data, offset: int, end: int) -> (int, int, int):
+    '''Reads the header of the chunk at offset, which has to end by end.'''
+
+    kind, headerSize, chunkSize = chunkHeader.unpack_from(data, offset)
+    if chunkSize == 0:
+        raise AxmlError("zero-length chunk at {}".format(offset))
+    if offset + chunkSize > end:
+        raise AxmlError("chunk at {} runs past the end".format(offset))
+    return (kind, headerSize, chunkSize)
+
+
+class StringPool:
+
+    '''A ResStringPool chunk. Strings are decoded on first access and kept,
+    so a pool shared by many lookups is only ever decoded once.'''
+
+    def __init__(self, data, offset: int):
+        _, headerSize, size = chunkHeader.unpack_from(data, offset)
+        count, _, flags, stringsStart, _ = struct.unpack_from("<5I", data, offset + 8)
+
+        self.data = data
+        self.utf8 = bool(flags & UTF8_FLAG)
+        self.start = offset + stringsStart
+        self.offsets = struct.unpack_from("<{}I".format(count), data, offset + headerSize)
+        self.strings = [None] * count
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> str:
+        if i == NO_INDEX:
+            return None
+
+        s = self.strings[i]
+        if s is None:
+            s = self.strings[i] = self._decode(self.start + self.offsets[i])
+        return s
+
+    def _decode(self, at: int) -> str:
+        data = self.data
+
+        if self.utf8:
+            # character count, then byte count; each one or two bytes long
+            for _ in range(2):
+                n = data[at]
+                at += 1
+                if n & 0x80:
+                    n = ((n & 0x7f) << 8) | data[at]
+                    at += 1
+            return bytes(data[at:at + n]).decode("utf-8", "replace")
+
+        n, = struct.unpack_from("<H", data, at)
+        at += 2
+        if n & 0x8000:
+            low, = struct.unpack_from("<H", data, at)
+            n = ((n & 0x7fff) << 16) | low
+            at += 2
+        return bytes(data[at:at + n * 2]).decode("utf-16-le", "replace")
+
+
+class ResourceTable:
+
+    '''The parts of resources.arsc we need: the name of every resource ID, and
+    the value of simple resources in the default configuration.'''
+
+    def __init__(self, data):
+        data = memoryview(data)
+
+        kind, headerSize, size = chunkHeader.unpack_from(data, 0)
+        if kind != RES_TABLE_TYPE:
+            raise AxmlError("not a resource table")
+        if size > len(data):
+            raise AxmlError("truncated: {} of {} bytes".format(len(data), size))
+
+        self.names = dict()   # resource ID -> "type/name"
+        self.values = dict()  # "type/name" -> Res_value as (dataType, data)
+
+        self.strings = None
+        offset = headerSize
+        while offset < size:
+            kind, _, chunkSize = _chunk(data, offset, size)
+            if kind == RES_STRING_POOL_TYPE:
+                self.strings = StringPool(data, offset)
+            elif kind == RES_TABLE_PACKAGE_TYPE:
+                self._readPackage(data, offset)
+            offset += chunkSize
+
+    def _readPackage(self, data, offset: int):
+        _, headerSize, size = chunkHeader.unpack_from(data, offset)
+        packageId, = struct.unpack_from("<I", data, offset + 8)
+        end = offset + size
+        typeStrings, _, keyStrings = struct.unpack_from("<3I", data, offset + 268)
+
+        types = StringPool(data, offset + typeStrings)
+        keys = StringPool(data, offset + keyStrings)
+
+        at = offset + headerSize
+        while at < end:
+            kind, _, chunkSize = _chunk(data, at, end)
+            if kind == RES_TABLE_TYPE_TYPE:
+                self._readType(data, at, packageId, types, keys)
+            at += chunkSize
+
+    def _readType(self, data, offset: int, packageId: int, types, keys):
+        _, headerSize, _ = chunkHeader.unpack_from(data, offset)
+        typeId, flags, _, entryCount, entriesStart = struct.unpack_from("<BBHII", data, offset + 8)
+
+        # the default configuration is all zeroes after its own size field
+        configSize, = struct.unpack_from("<I", data, offset + 20)
+        default = not any(data[offset + 24:offset + 20 + configSize])
+
+        typeName = types[typeId - 1]
+        prefix = (packageId << 24) | (typeId << 16)
+
+        at = offset + headerSize
+        if flags & FLAG_SPARSE:
+            pairs = struct.unpack_from("<{}H".format(entryCount * 2), data, at)
+            entries = zip(pairs[0::2], ( o * 4 for o in pairs[1::2] ))
+        elif flags & FLAG_OFFSET16:
+            offsets = struct.unpack_from("<{}H".format(entryCount), data, at)
+            entries = ( (i, o * 4) for i, o in enumerate(offsets) if o != 0xffff )
+        else:
+            offsets = struct.unpack_from("<{}I".format(entryCount), data, at)
+            entries = ( (i, o) for i, o in enumerate(offsets) if o != NO_ENTRY )
+
+        for index, entryOffset in entries:
+            at = offset + entriesStart + entryOffset
+            size, entryFlags, key = struct.unpack_from("<HHI", data, at)
+
+            if entryFlags & FLAG_COMPACT:
+                # key lives in the size field, the type in the high flag byte
+                name = "{}/{}".format(typeName, keys[size])
+                value = (entryFlags >> 8, key)
+            else:
+                name = "{}/{}".format(typeName, keys[key])
+                value = None
+                if not entryFlags & FLAG_COMPLEX:
+                    # skip Res_value.size and Res_value.res0
+                    value = struct.unpack_from("<BI", data, at + size + 3)
+
+            self.names.setdefault(prefix | index, name)
+            if default and value is not None:
+                self.values.setdefault(name, value)
+
+    def name(self, resourceId: int) -> str:
+        '''Gives "type/name" for a resource ID, or None if it's not ours.'''
+        return self.names.get(resourceId)
+
+    def value(self, name: str) -> str:
+        '''Gives the default value of a simple resource, formatted as it would
+        be written in a values XML file.'''
+
+        try:
+            dataType, data = self.values[name]
+        except KeyError:
+            return None
+        return formatValue(dataType, data, self.strings, self)
+
+
+def complexToFloat(data: int) -> float:
+    '''Unpacks the mantissa and radix of a dimension or fraction.'''
+    mantissa = struct.unpack("<i", struct.pack("<I", data & 0xffffff00))[0]
+    return mantissa * RADIX_MULTS[(data >> 4) & 0x3]
+
+
+def _number(x: float) -> str:
+    return str(int(x)) if x == int(x) else "{:g}".format(x)
+
+
+def formatReference(sigil: str, data: int, table: ResourceTable) -> str:
+    '''Turns a resource ID back into "@type/name" (or "?type/name").'''
+
+    if data == 0:
+        return "@null"
+
+    name = table.name(data) if table is not None else None
+    if name is None:
+        return "{}0x{:08x}".format(sigil, data)
+    return sigil + name
+
+
+def formatValue(dataType: int, data: int, strings: StringPool, table: ResourceTable) -> str:
+    '''Formats a Res_value the way it would be spelled in source XML.'''
+
+    if dataType == TYPE_STRING:
+        return strings[data]
+    if dataType in (TYPE_REFERENCE, TYPE_DYNAMIC_REFERENCE):
+        return formatReference('@', data, table)
+    if dataType == TYPE_ATTRIBUTE:
+        return formatReference('?', data, table)
+    if dataType == TYPE_INT_BOOLEAN:
+        return "true" if data else "false"
+    if dataType == TYPE_INT_HEX:
+        return "0x{:x}".format(data)
+    if dataType == TYPE_INT_DEC:
+        return str(struct.unpack("<i", struct.pack("<I", data))[0])
+    if dataType == TYPE_FLOAT:
+        return _number(struct.unpack("<f", struct.pack("<I", data))[0])
+    if dataType == TYPE_DIMENSION:
+        return _number(complexToFloat(data)) + DIMENSION_UNITS[data & 0xf]
+    if dataType == TYPE_FRACTION:
+        return _number(complexToFloat(data) * 100) + FRACTION_UNITS[data & 0xf]
+    if TYPE_FIRST_COLOR_INT <= dataType <= TYPE_LAST_COLOR_INT:
+        return "#{:08x}".format(data)
+    if dataType == TYPE_NULL:
+        return None
+    return "0x{:x}".format(data)
+
+
+def events(data, table: ResourceTable = None):
+    '''Walks an AXML buffer, yielding ("start", name, attributes),
+    ("end", name, None) and ("text", text, None) events. Attribute names carry
+    their namespace prefix ("android:text"), and values are formatted as in
+    source XML, with references resolved through table if one is given.'''
+
+    kind, headerSize, size = chunkHeader.unpack_from(data, 0)
+    if kind != RES_XML_TYPE:
+        raise AxmlError("not binary XML")
+    if size > len(data):
+        raise AxmlError("truncated: {} of {} bytes".format(len(data), size))
+
+    strings = None
+    prefixes = dict()  # namespace URI -> prefix
+
+    offset = headerSize
+    while offset < size:
+        kind, chunkHeaderSize, chunkSize = _chunk(data, offset, size)
+
+        ext = offset + chunkHeaderSize
+
+        if kind == RES_STRING_POOL_TYPE:
+            strings = StringPool(data, offset)
+
+        elif kind == RES_XML_START_NAMESPACE_TYPE:
+            prefix, uri = struct.unpack_from("<II", data, ext)
+            prefixes[strings[uri]] = strings[prefix]
+
+        elif kind == RES_XML_START_ELEMENT_TYPE:
+            _, name, attrStart, attrSize, attrCount = struct.unpack_from("<IIHHH", data, ext)
+
+            attributes = dict()
+            at = ext + attrStart
+            for _ in range(attrCount):
+                ns, attrName, raw, dataType, value = struct.unpack_from("<III3xBI", data, at)
+                at += attrSize
+
+                attrName = strings[attrName]
+                if raw != NO_INDEX:
+                    value = strings[raw]
+                elif dataType in (TYPE_INT_DEC, TYPE_INT_HEX) and attrName in ENUMS:
+                    signed = struct.unpack("<i", struct.pack("<I", value))[0]
+                    value = ENUMS[attrName].get(signed, formatValue(dataType, value, strings, table))
+                else:
+                    value = formatValue(dataType, value, strings, table)
+
+                prefix = prefixes.get(strings[ns]) if ns != NO_INDEX else None
+                if prefix:
+                    attrName = "{}:{}".format(prefix, attrName)
+                attributes[attrName] = value
+
+            yield ("start", strings[name], attributes)
+
+        elif kind == RES_XML_END_ELEMENT_TYPE:
+            _, name = struct.unpack_from("<II", data, ext)
+            yield ("end", strings[name], None)
+
+        elif kind == RES_XML_CDATA_TYPE:
+            text, = struct.unpack_from("<I", data, ext)
+            yield ("text", strings[text], None)
+
+        offset += chunkSize
+
+
+@memoize(maxsize=8)
+def apkResources(apkPath: str) -> ResourceTable:
+    '''Decodes an APK's resources.arsc, once per APK. Gives None if the APK
+    doesn't have one.'''
+
+    import zipfile
+
+    with zipfile.ZipFile(apkPath) as zf:
+        try:
+            data = zf.read("resources.arsc")
+        except KeyError:
+            return None
+
+    return ResourceTable(data)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+"""bench, reproducible benchmarks for aguille
+
+Usage:
+  bench.py [options]
+  bench.py (-h | --help)
+
+Options:
+  -o JSON         Write results to JSON.
+  --compare OLD   Compare with the results in OLD, and fail if anything got
+                  slower by more than the tolerance.
+  --tolerance X   Allowed slowdown, as a fraction [default: 0.25].
+  --seed N        Seed for the synthetic corpus [default: 0].
+  --apps N        Applications in the corpus [default: 20].
+  --layouts N     Layouts per application [default: 10].
+  --depth N       Deepest nesting of layouts [default: 4].
+  --repeat N      Time each benchmark this many times [default: 3].
+  --corpus DIR    Build the corpus in DIR instead of a temporary folder.
+  -h --help       Show this screen.
+
+Each benchmark is timed on its own against a synthetic repository. The best of
+the repeated runs is what gets compared. "startup" runs "aguille.py --version"
+in fresh interpreters; compare it with "interpreter", which runs nothing. "lxml"
+counts the same tags as "tags" with the lxml parser instead of bs4."""
+
+import contextlib
+import json
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from docopt import docopt
+
+import aguille  # local
+import synthetic  # local
+
+AGUILLE = str(pathlib.Path(__file__).resolve().with_name("aguille.py"))
+
+# fresh interpreters started per startup benchmark run
+STARTUP_RUNS = 10
+
+
+@contextlib.contextmanager
+def _quiet():
+    '''Silences stdout, including the subprocesses aguille uses to echo.'''
+
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), 1)
+        try:
+            with contextlib.redirect_stdout(devnull):
+                yield
+        finally:
+            os.dup2(saved, 1)
+            os.close(saved)
+
+
+def timeit(fn, repeat: int) -> dict:
+    '''Runs fn repeat times. fn returns how many items it handled and how many
+    of those failed.'''
+
+    runs = []
+    for _ in range(repeat):
+        with _quiet():
+            start = time.perf_counter()
+            items, errors = fn()
+            runs.append(time.perf_counter() - start)
+
+    best = min(runs)
+    return {
+        "best": best,
+        "median": statistics.median(runs),
+        "runs": runs,
+        "items": items,
+        "errors": errors,
+        "perItem": best / items if items else None,
+    }
+
+
+def importedBy(code: str) -> set:
+    '''Lists the modules a fresh interpreter has loaded after running code.'''
+    show = "; import sys; print('\\n'.join(sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code + show], check=True,
+            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return set(out.split())
+
+
+def launch(argv: [str, ...], runs: int = STARTUP_RUNS) -> float:
+    '''Starts a fresh interpreter runs times, giving the best wall time.'''
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + argv, check=True, stdout=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def startupOverhead(runs: int = STARTUP_RUNS) -> (float, float):
+    '''How much longer "aguille.py --version" takes than a bare interpreter,
+    and how long the bare interpreter takes.'''
+    bare = launch(["-c", "pass"], runs)
+    return (launch([AGUILLE, "--version"], runs) - bare, bare)
+
+
+def _skip(reason: str) -> dict:
+    return { "skipped": reason }
+
+
+class Suite:
+
+    '''The benchmarks, sharing one corpus and the soup parsed from it.'''
+
+    def __init__(self, root: pathlib.Path, repeat: int):
+        self.root = root
+        self.repeat = repeat
+
+        with _quiet():
+            self.dirs = aguille._getRepoDirs(root, log=lambda x: None, status=lambda x: None)
+
+        self.soups = []  # (root element, res/values paths)
+        self.references = []  # (value, res/values paths)
+        for layoutPaths, valuesPaths in self.dirs:
+            for p in layoutPaths:
+                soups, _ = aguille.appSoup(p)
+                for soup in soups:
+                    self.soups.append((soup.find(True), valuesPaths))
+                    for tag in soup.find_all(True):
+                        for k, v in tag.attrs.items():
+                            if v.startswith("@") and not v.startswith("@+"):
+                                self.references.append((v, valuesPaths))
+
+    def interpreter(self):
+        launch(["-c", "pass"])
+        return (STARTUP_RUNS, 0)
+
+    def startup(self):
+        launch([AGUILLE, "--version"])
+        return (STARTUP_RUNS, 0)
+
+    def discovery(self):
+        # without status, echo would fork for every app, and that's what
+        # would be timed
+        return (len(aguille._getRepoDirs(self.root, log=lambda x: None, status=lambda x: None)), 0)
+
+    def tags(self):
+        for layoutPaths, _ in self.dirs:
+            aguille.countAppTags(layoutPaths, custom=True)
+        return (len(self.dirs), 0)
+
+    def lxml(self):
+        for layoutPaths, _ in self.dirs:
+            aguille.countAppTags(layoutPaths, custom=True, parser="lxml")
+        return (len(self.dirs), 0)
+
+    def resources(self):
+        import android
+        android._appResources.cache_clear()
+        for value, valuesPaths in self.references:
+            android.resource(value, valuesPaths)
+        return (len(self.references), 0)
+
+    def text(self):
+        import android
+        from devices import galaxyS3
+        android.AndroidDevice._textDimensions.cache_clear()
+        words = sorted(set(synthetic.WORDS))
+        for word in words:
+            for size in synthetic.TEXT_SIZES:
+                galaxyS3.textDimensions(word, size=size)
+        return (len(words) * len(synthetic.TEXT_SIZES), 0)
+
+    def lexing(self):
+        import android
+        from devices import galaxyS3
+        android._appResources.cache_clear()
+        errors = 0
+        for element, valuesPaths in self.soups:
+            try:
+                android.AndroidElement.dispatchFromSoup(None, element, valuesPaths, device=galaxyS3)
+            except ImportError:
+                raise
+            except Exception:
+                errors += 1
+        return (len(self.soups), errors)
+
+    def run(self) -> dict:
+        results = dict()
+        names = ("interpreter", "startup", "discovery", "tags", "lxml", "resources", "text", "lexing")
+        for name in names:
+            try:
+                results[name] = timeit(getattr(self, name), self.repeat)
+            except ImportError as e:
+                # e.g. pygame isn't installed; nothing to measure
+                results[name] = _skip(str(e))
+            print("{:10} {}".format(name, _describe(results[name])))
+        return results
+
+
+def _describe(result: dict) -> str:
+    if "skipped" in result:
+        return "skipped: " + result["skipped"]
+    m = "{:9.4f}s best of {}, {} items".format(result["best"], len(result["runs"]), result["items"])
+    if result["errors"]:
+        m += ", {} errors".format(result["errors"])
+    return m
+
+
+def compare(new: dict, old: dict, tolerance: float) -> [str, ...]:
+    '''Lists the benchmarks that got slower than old by more than tolerance.'''
+
+    regressions = []
+    for name, result in new["results"].items():
+        before = old["results"].get(name, {})
+        if "best" not in result or "best" not in before:
+            continue
+        ratio = result["best"] / before["best"]
+        print("{:10} {:6.2f}x".format(name, ratio))
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(args) -> int:
+    corpus = synthetic.Corpus(
+        seed=int(args["--seed"]),
+        apps=int(args["--apps"]),
+        layouts=int(args["--layouts"]),
+        depth=int(args["--depth"]),
+    )
+
+    with contextlib.ExitStack() as stack:
+        if args["--corpus"]:
+            root = pathlib.Path(args["--corpus"])
+        else:
+            root = pathlib.Path(stack.enter_context(tempfile.TemporaryDirectory()))
+
+        print("Building synthetic corpus in {}...".format(root))
+        corpus.write(root)
+
+        results = Suite(root, int(args["--repeat"])).run()
+
+    report = {
+        "aguille": aguille.VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": corpus.params(),
+        "repeat": int(args["--repeat"]),
+        "results": results,
+    }
+
+    if args["-o"]:
+        with open(args["-o"], 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args["--compare"]:
+        with open(args["--compare"], 'r') as f:
+            old = json.load(f)
+        regressions = compare(report, old, float(args["--tolerance"]))
+        if regressions:
+            print("Slower than before:", ", ".join(regressions))
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(docopt(__doc__)))
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+'''Durable progress for long runs. Discovery results and finished rows are
+appended to a JSON-lines file as they're produced, so a crashed run can pick
+up where it left off and still write exactly what an uninterrupted run would.'''
+
+import json
+import os
+import pathlib
+
+
+class Checkpoint:
+
+    '''Progress of one run. With no path, progress is only kept in memory.
+    With resume, progress already recorded in path is loaded first; otherwise
+    path is started over. settings are whatever changes the rows a run makes;
+    they're recorded first, and a run with other settings can't resume,
+    since its rows couldn't be mixed with the recorded ones.'''
+
+    def __init__(self, path: pathlib.Path = None, *, resume=False, settings: dict = None):
+        self.path = path
+        self.settings = None  # as recorded, when resuming
+        self.records = 0  # records loaded by resume
+        self.repos = None  # every application folder, in discovery order
+        self.found = dict()  # application folder -> (layouts, values), or None if broken
+        self.rows = dict()  # app key -> CSV row, or None, for apps loaded by resume
+        self.skipped = dict()  # app key -> [(path, reason), ...], likewise
+        self.done = set()  # app keys finished in this run; their rows aren't kept
+        self.f = None
+
+        if path is None:
+            return
+
+        if resume and path.exists():
+            self._load()
+            if self.records > 0 and self.settings != settings:
+                raise ValueError("{} was recorded with settings {}, not {}; can't resume".format(
+                    path, self.settings, settings))
+            self.f = path.open('a')
+        else:
+            self.f = path.open('w')
+
+        if self.records == 0:
+            self._write({ "kind": "settings", "settings": settings })
+
+    def _load(self):
+        good = 0
+        with self.path.open('rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except (UnicodeDecodeError, ValueError):
+                    # a line torn by the crash; everything after it is suspect
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self._apply(record)
+                self.records += 1
+                good += len(line)
+
+        # drop the torn tail so new records start on a fresh line
+        with self.path.open('r+b') as f:
+            f.truncate(good)
+
+    def _apply(self, record: dict):
+        kind = record["kind"]
+        if kind == "settings":
+            self.settings = record["settings"]
+        elif kind == "repos":
+            self.repos = [ pathlib.Path(r) for r in record["repos"] ]
+        elif kind == "found":
+            found = record["found"]
+            if found is not None:
+                found = tuple([ pathlib.Path(p) for p in paths ] for paths in found)
+            self.found[record["repo"]] = found
+        elif kind == "app":
+            self.rows[record["key"]] = record["row"]
+            self.skipped[record["key"]] = [ tuple(s) for s in record["skipped"] ]
+
+    def _write(self, record: dict):
+        if self.f is None:
+            return
+        self.f.write(json.dumps(record) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def recordRepos(self, repos: [pathlib.Path, ...]) -> None:
+        '''Records the list of application folders to search.'''
+        self.repos = list(repos)
+        self._write({ "kind": "repos", "repos": [ str(r) for r in repos ] })
+
+    def recordFound(self, repo: pathlib.Path, found: (["res/layout", ...], ["res/values", ...])) -> None:
+        '''Records the layouts and values found in one application folder, or
+        None if the folder couldn't be searched.'''
+
+        self.found[str(repo)] = found
+        if found is not None:
+            found = [ [ str(p) for p in paths ] for paths in found ]
+        self._write({ "kind": "found", "repo": str(repo), "found": found })
+
+    def isFound(self, repo: pathlib.Path) -> bool:
+        return str(repo) in self.found
+
+    def recordApp(self, key: str, row: dict, skipped: [("path", "reason"), ...]) -> None:
+        '''Records a finished application: its CSV row (or None if it doesn't
+        get one) and the layouts that were skipped. Only the file keeps the
+        row; memory doesn't grow with the run.'''
+
+        self.done.add(key)
+        skipped = [ [ str(p), reason ] for p, reason in skipped ]
+        self._write({ "kind": "app", "key": key, "row": row, "skipped": skipped })
+
+    def isDone(self, key: str) -> bool:
+        return key in self.done or key in self.rows
+
+    def popApp(self, key: str) -> (dict, [("path", "reason"), ...]):
+        '''Hands over, and forgets, the row and skipped layouts of an app that
+        was finished before the run resumed.'''
+        self.done.add(key)
+        return (self.rows.pop(key), self.skipped.pop(key))
+
+    def close(self) -> None:
+        if self.f is not None:
+            self.f.close()
+            self.f = None
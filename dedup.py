@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+'''Run-wide memory of analyzed layouts, keyed by their bytes and how they were
+analyzed. Forks and vendored libraries carry byte-identical layouts; each
+distinct one only needs to be analyzed once.'''
+
+import hashlib
+
+import reader  # local
+
+
+def fingerprint(data) -> bytes:
+    '''A fast 128-bit digest of a layout's bytes.'''
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class LayoutCache:
+
+    '''Maps layout contents to the result of analyzing them. Layouts are told
+    apart by size first; a layout is only hashed once another layout of the
+    same size has turned up, so most layouts are never hashed at all. Results
+    depend on how a layout was analyzed as well as its bytes, so each is kept
+    under the settings it was made with; one cache can serve runs with
+    different settings without mixing them up.'''
+
+    def __init__(self):
+        # (settings, size) -> (path, result) of the only layout of that size
+        # so far
+        self.lone = dict()
+        # (settings, size) with more than one layout; those layouts are hashed
+        self.sizes = set()
+        # ((settings, size), digest) -> result
+        self.results = dict()
+
+        self.seen = 0
+        self.hits = 0
+        self.savedBytes = 0
+        self.hashed = 0
+        self.reread = 0
+
+    def get(self, buf: reader.LayoutBuffer, settings=None) -> ("key", "result"):
+        '''Gives the result stored for a layout with the same bytes as buf,
+        analyzed with the same settings (anything hashable), or None, along
+        with a key to put buf's own result under.'''
+
+        self.seen += 1
+        slot = (settings, len(buf))
+
+        if slot not in self.lone and slot not in self.sizes:
+            return ((slot, None), None)
+
+        self._promote(slot)
+        key = (slot, fingerprint(buf.data))
+        self.hashed += 1
+
+        result = self.results.get(key)
+        if result is not None:
+            self.hits += 1
+            self.savedBytes += len(buf)
+        return (key, result)
+
+    def put(self, key, buf: reader.LayoutBuffer, result) -> None:
+        '''Stores the result of analyzing buf under the key get gave.'''
+
+        slot, digest = key
+        if digest is None:
+            self.lone[slot] = (buf.path, result)
+        else:
+            self.results[key] = result
+
+    def _promote(self, slot: ("settings", "size")):
+        '''The first layout of a size was never hashed. Now that a second one
+        has come along, read the first one back and hash it.'''
+
+        self.sizes.add(slot)
+        try:
+            path, result = self.lone.pop(slot)
+        except KeyError:
+            return
+
+        self.reread += 1
+        try:
+            with reader.openLayout(path) as first:
+                if len(first) == slot[1]:
+                    self.results[(slot, fingerprint(first.data))] = result
+                    self.hashed += 1
+        except reader.SkippedLayout:
+            # gone since; it just won't be shared
+            pass
+
+    def report(self, log=print) -> None:
+        '''Prints how much work deduplication saved.'''
+        unique = self.seen - self.hits
+        log("Layouts: {} seen, {} unique, {} duplicates ({} bytes not parsed again)".format(
+            self.seen, unique, self.hits, self.savedBytes))
+        log("         {} hashed, {} read again to hash".format(self.hashed, self.reread))
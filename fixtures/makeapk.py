@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+'''Writes app.apk, a tiny APK for test.py: two copies of one binary XML
+layout (res/layout and res/layout-land) and a resources.arsc with a single
+string, built chunk by chunk so the AXML decoder has something known to read.
+Run it again only if the fixture has to change.'''
+
+import pathlib
+import struct
+import zipfile
+
+ANDROID = "http://schemas.android.com/apk/res/android"
+NO_INDEX = 0xffffffff
+
+# Res_value data types
+TYPE_REFERENCE = 0x01
+TYPE_STRING = 0x03
+TYPE_DIMENSION = 0x05
+TYPE_INT_DEC = 0x10
+
+STRINGS = [
+    "android", ANDROID, "LinearLayout", "Button", "orientation", "layout_width",
+    "text", "layout_height", "textSize", "com.example.Custom", "label", "hi",
+]
+
+
+def stringPool(strings: [str, ...], utf8=False) -> bytes:
+    offsets = []
+    body = b''
+    for s in strings:
+        offsets.append(len(body))
+        if utf8:
+            b = s.encode("utf-8")
+            body += bytes([len(s), len(b)]) + b + b"\0"
+        else:
+            body += struct.pack("<H", len(s)) + s.encode("utf-16-le") + b"\0\0"
+    while len(body) % 4:
+        body += b"\0"
+
+    headerSize = 28
+    start = headerSize + 4 * len(strings)
+    header = struct.pack("<HHI5I", 0x0001, headerSize, start + len(body),
+            len(strings), 0, 0x100 if utf8 else 0, start, 0)
+    return header + b''.join( struct.pack("<I", o) for o in offsets ) + body
+
+
+def layout() -> bytes:
+    '''<LinearLayout android:orientation="vertical" android:layout_width="match_parent">
+         <Button android:text="@string/greeting" android:layout_height="wrap_content" android:textSize="16sp"/>
+         <com.example.Custom android:label="hi"/>
+       </LinearLayout>'''
+
+    s = STRINGS.index
+
+    def start(name, attrs):
+        body = b''
+        for attrName, (dataType, data, raw) in attrs:
+            body += struct.pack("<III", s(ANDROID), s(attrName), raw)
+            body += struct.pack("<HBBI", 8, 0, dataType, data)
+        ext = struct.pack("<IIHHHHHH", NO_INDEX, s(name), 20, 20, len(attrs), 0, 0, 0)
+        return struct.pack("<HHIII", 0x0102, 16, 16 + len(ext + body), 1, NO_INDEX) + ext + body
+
+    def end(name):
+        return struct.pack("<HHIII", 0x0103, 16, 24, 1, NO_INDEX) + struct.pack("<II", NO_INDEX, s(name))
+
+    chunks = [
+        struct.pack("<HHIII", 0x0100, 16, 24, 1, NO_INDEX) + struct.pack("<II", s("android"), s(ANDROID)),
+        start("LinearLayout", [
+            ("orientation", (TYPE_INT_DEC, 1, NO_INDEX)),
+            ("layout_width", (TYPE_INT_DEC, 0xffffffff, NO_INDEX)),
+        ]),
+        start("Button", [
+            ("text", (TYPE_REFERENCE, 0x7f010000, NO_INDEX)),
+            ("layout_height", (TYPE_INT_DEC, 0xfffffffe, NO_INDEX)),
+            ("textSize", (TYPE_DIMENSION, (16 << 8) | 2, NO_INDEX)),
+        ]),
+        end("Button"),
+        start("com.example.Custom", [("label", (TYPE_STRING, s("hi"), s("hi")))]),
+        end("com.example.Custom"),
+        end("LinearLayout"),
+    ]
+
+    body = stringPool(STRINGS) + b''.join(chunks)
+    return struct.pack("<HHI", 0x0003, 8, 8 + len(body)) + body
+
+
+def resources() -> bytes:
+    '''A table for package 0x7f with string/greeting (0x7f010000) = "Hello!".'''
+
+    globalStrings = stringPool(["Hello!"], utf8=True)
+    types = stringPool(["string"])
+    keys = stringPool(["greeting"])
+
+    # the default configuration: all zeroes
+    config = struct.pack("<I", 64) + b"\0" * 60
+    headerSize = 20 + len(config)
+    offsets = struct.pack("<I", 0)
+    entry = struct.pack("<HHI", 8, 0, 0) + struct.pack("<HBBI", 8, 0, TYPE_STRING, 0)
+    entriesStart = headerSize + len(offsets)
+    typeChunk = struct.pack("<HHIBBHII", 0x0201, headerSize, entriesStart + len(entry),
+            1, 0, 0, 1, entriesStart) + config + offsets + entry
+
+    packageHeaderSize = 288
+    body = types + keys + typeChunk
+    package = struct.pack("<HHII", 0x0200, packageHeaderSize, packageHeaderSize + len(body), 0x7f)
+    package += b"\0" * 256
+    package += struct.pack("<5I", packageHeaderSize, 0, packageHeaderSize + len(types), 0, 0)
+    package += body
+
+    body = globalStrings + package
+    return struct.pack("<HHII", 0x0002, 12, 12 + len(body), 1) + body
+
+
+def write(path: pathlib.Path) -> None:
+    # fixed timestamps, so the fixture comes out byte for byte the same
+    date = (1980, 1, 1, 0, 0, 0)
+    with zipfile.ZipFile(str(path), 'w') as zf:
+        for name, data in (
+                ("res/layout/main.xml", layout()),
+                ("res/layout-land/main.xml", layout()),
+                ("resources.arsc", resources()),
+                ("classes.dex", b"dex\n")):
+            zf.writestr(zipfile.ZipInfo(name, date), data)
+
+
+if __name__ == "__main__":
+    write(pathlib.Path(__file__).resolve().with_name("app.apk"))
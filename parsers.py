@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+'''The XML parsers layouts and resources can be read with. Every parser gives
+its own kind of document, but answers the same questions about it: which tags
+it has, how many buttons, what's in a res/values file. "bs4" gives the
+BeautifulSoup the rest of aguille works with; "lxml" skips the soup and walks
+lxml's own tree, which is much faster when only counts are wanted.'''
+
+from functools import lru_cache as memoize
+
+import axml  # local
+import reader  # local
+
+DEFAULT = "bs4"
+
+ANDROID = "http://schemas.android.com/apk/res/android"
+
+
+def bs(x) -> "soup":
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(x, "xml")
+
+
+class SoupParser:
+
+    '''Parses with BeautifulSoup. Documents are soup.'''
+
+    name = "bs4"
+
+    def parse(self, buf: reader.LayoutBuffer) -> "soup":
+        '''Parses a plain-text XML layout buffer. The raw bytes go straight to
+        the parser along with the sniffed encoding.'''
+
+        from bs4 import BeautifulSoup
+        from bs4.builder import ParserRejectedMarkup
+
+        try:
+            if buf.encoding in reader.WIDE:
+                return BeautifulSoup(reader.toUtf8(buf.data, buf.encoding), "xml", from_encoding="utf-8")
+            return BeautifulSoup(buf.data, "xml", from_encoding=buf.encoding)
+        except (UnicodeDecodeError, ParserRejectedMarkup) as e:
+            raise reader.SkippedLayout(buf.path, "{} ({})".format(type(e).__name__, buf.encoding))
+
+    def isEmpty(self, soup: "soup") -> bool:
+        '''Checks whether a document came out without a single element.'''
+        return soup.find(True) is None
+
+    def build(self, events) -> "soup":
+        '''Builds a document from axml.events.'''
+
+        soup = bs("")
+        stack = [soup]
+        for kind, name, attrs in events:
+            if kind == "start":
+                attrs = { k: v for k, v in attrs.items() if v is not None }
+                tag = soup.new_tag(name, attrs=attrs)
+                stack[-1].append(tag)
+                stack.append(tag)
+            elif kind == "end":
+                stack.pop()
+            elif name:
+                stack[-1].append(soup.new_string(name))
+        return soup
+
+    def tagNames(self, soup: "soup") -> ["name", ...]:
+        '''Gives the name of every tag, prefix and all, in document order.'''
+        return ( tag.name for tag in soup.find_all(True) )
+
+    def countButtons(self, soup: "soup") -> int:
+        return len(soup("Button"))
+
+    def resources(self, f) -> [("kind", {"attr": "value"}, "string", [("kind", {}, "string"), ...]), ...]:
+        '''Lists the entries of a res/values file: the kind, attributes and
+        string of every child of <resources>, with the same for the entry's
+        own children (a style's items).'''
+
+        rsoup = bs(f).find("resources")
+        if rsoup is None:
+            return []
+
+        return [ (tag.name, tag.attrs, tag.string,
+                    [ (child.name, child.attrs, child.string) for child in tag.find_all(True, recursive=False) ])
+                for tag in rsoup.find_all(True, recursive=False) ]
+
+    def attributes(self, f, tagName: str) -> {"attr": "value"}:
+        '''Gives the attributes of the first tagName element in a file, or
+        None if it hasn't got one.'''
+        found = bs(f).find(tagName)
+        return None if found is None else found.attrs
+
+
+class LxmlParser:
+
+    '''Parses with lxml.etree. Documents are root elements (or None, for a
+    document with no elements at all). The parser recovers from bad markup
+    the way BeautifulSoup's does, so both give the same tags.'''
+
+    name = "lxml"
+
+    def __init__(self):
+        from lxml import etree
+        self.etree = etree
+
+        self.buttons = etree.XPath("count(//*[name() = 'Button'])")
+        self.entries = etree.XPath("/resources/*")
+        self.children = etree.XPath("*")
+
+        # libxml2 doesn't know Python's codec names ("euc_jp", "mac-roman")
+        # and reads wide encodings by their BOM, so every buffer is handed
+        # over as UTF-8
+        self.parser = etree.XMLParser(recover=True, encoding="utf-8",
+                resolve_entities=False, no_network=True, huge_tree=True)
+
+    def _fromBytes(self, data, encoding: str):
+        if encoding not in ("utf-8", "ascii"):
+            data = reader.toUtf8(data, encoding)
+        try:
+            return self.etree.fromstring(bytes(data), self.parser)
+        except self.etree.XMLSyntaxError:
+            # nothing worth recovering; soup would be empty too
+            return None
+
+    def parse(self, buf: reader.LayoutBuffer):
+        try:
+            return self._fromBytes(buf.data, buf.encoding)
+        except (LookupError, UnicodeDecodeError) as e:
+            raise reader.SkippedLayout(buf.path, "{} ({})".format(type(e).__name__, buf.encoding))
+
+    def build(self, events):
+        builder = self.etree.TreeBuilder()
+        nsmap = { "android": ANDROID }
+        stack = []
+        try:
+            for kind, name, attrs in events:
+                if kind == "start":
+                    attrs = { self._attrName(k): v for k, v in attrs.items() if v is not None }
+                    builder.start(name, attrs, nsmap)
+                    stack.append(name)
+                elif kind == "end":
+                    # close whatever's open, as soup does, whatever name the
+                    # end event gives
+                    if stack:
+                        builder.end(stack.pop())
+                elif name:
+                    builder.data(name)
+        except ValueError as e:
+            # names that are fine in AXML but not in XML
+            raise axml.AxmlError(str(e))
+
+        while stack:
+            builder.end(stack.pop())
+        try:
+            return builder.close()
+        except AssertionError:
+            # no elements at all
+            return None
+
+    @staticmethod
+    def _attrName(name: str) -> str:
+        prefix, sep, local = name.partition(':')
+        if not sep:
+            return name
+        uri = ANDROID if prefix == "android" else "urn:aguille:" + prefix
+        return "{{{}}}{}".format(uri, local)
+
+    @staticmethod
+    def _name(el) -> str:
+        '''An element or attribute name as soup gives it: "prefix:local".'''
+        tag = el.tag
+        if tag[0] != '{':
+            return tag
+        local = tag[tag.index('}') + 1:]
+        return local if el.prefix is None else "{}:{}".format(el.prefix, local)
+
+    def _attrs(self, el) -> {"attr": "value"}:
+        attrs = dict()
+        for k, v in el.attrib.items():
+            if k[0] == '{':
+                uri, _, local = k[1:].partition('}')
+                prefix = next(( p for p, u in el.nsmap.items() if u == uri and p ), None)
+                if prefix is not None:
+                    k = "{}:{}".format(prefix, local)
+                else:
+                    k = local
+            attrs[k] = v
+        return attrs
+
+    @classmethod
+    def _string(cls, el) -> str:
+        '''The element's string as soup gives it: its text if that's all it
+        has, its only child's string if that's all it has, or None.'''
+
+        if len(el) == 0:
+            return el.text
+        if len(el) == 1 and not el.text and not el[0].tail and isinstance(el[0].tag, str):
+            return cls._string(el[0])
+        return None
+
+    def tagNames(self, root) -> ["name", ...]:
+        if root is None:
+            return ()
+        return ( self._name(el) for el in root.iter(self.etree.Element) )
+
+    def isEmpty(self, root) -> bool:
+        return root is None
+
+    def countButtons(self, root) -> int:
+        if root is None:
+            return 0
+        return int(self.buttons(root))
+
+    def _tree(self, f):
+        data = f.read()
+        try:
+            return self._fromBytes(data, reader.sniffEncoding(data))
+        except (LookupError, UnicodeDecodeError):
+            return None
+
+    def resources(self, f) -> [("kind", {"attr": "value"}, "string", [("kind", {}, "string"), ...]), ...]:
+        tree = self._tree(f)
+        if tree is None:
+            return []
+
+        return [ (self._name(el), self._attrs(el), self._string(el),
+                    [ (self._name(child), self._attrs(child), self._string(child)) for child in self.children(el) ])
+                for el in self.entries(tree) ]
+
+    def attributes(self, f, tagName: str) -> {"attr": "value"}:
+        tree = self._tree(f)
+        if tree is None:
+            return None
+        for el in tree.iter(self.etree.Element):
+            if self._name(el) == tagName:
+                return self._attrs(el)
+        return None
+
+
+PARSERS = {
+    "bs4": SoupParser,
+    "lxml": LxmlParser,
+}
+
+
+@memoize()
+def get(name: str = None):
+    '''Gives the parser called name, or the default one.'''
+
+    name = name or DEFAULT
+    try:
+        return PARSERS[name]()
+    except KeyError:
+        raise ValueError("no parser called {}; try one of {}".format(name, ", ".join(sorted(PARSERS))))
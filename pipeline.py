@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+'''A bounded producer/consumer pipeline. An I/O stage loads items ahead of the
+consumer on background threads while the consumer parses the current one, and
+both stages keep track of where their time goes.'''
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+
+
+class StageTimes:
+
+    '''Seconds spent per stage, split into time spent working and time spent
+    waiting on the other stage.'''
+
+    def __init__(self):
+        self.times = dict()
+        self.lock = threading.Lock()
+
+    def add(self, stage: str, kind: str, seconds: float) -> None:
+        with self.lock:
+            key = (stage, kind)
+            self.times[key] = self.times.get(key, 0.0) + seconds
+
+    def get(self, stage: str, kind: str) -> float:
+        return self.times.get((stage, kind), 0.0)
+
+    def report(self, log=print) -> None:
+        '''Prints how long each stage worked and waited.'''
+        log("read:  {:8.2f}s reading, {:8.2f}s blocked on a full queue".format(
+            self.get("read", "working"), self.get("read", "waiting")))
+        log("parse: {:8.2f}s parsing, {:8.2f}s waiting for reads".format(
+            self.get("parse", "working"), self.get("parse", "waiting")))
+
+
+def _timed(load, item, times: StageTimes):
+    start = time.perf_counter()
+    try:
+        return load(item)
+    finally:
+        times.add("read", "working", time.perf_counter() - start)
+
+
+def prefetch(items, load, *, depth=2, workers=1, times: StageTimes = None):
+    '''Yields (item, load(item)) for each item, in order. Up to depth items are
+    loaded ahead of the consumer by a pool of worker threads; once that many
+    are waiting, the producer blocks until the consumer catches up. A depth of
+    zero loads each item inline, just before it's yielded. Exceptions raised by
+    load surface here, when their item comes up.'''
+
+    if times is None:
+        times = StageTimes()
+
+    if depth <= 0:
+        for item in items:
+            loaded = _timed(load, item, times)
+            start = time.perf_counter()
+            yield (item, loaded)
+            times.add("parse", "working", time.perf_counter() - start)
+        return
+
+    q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=workers)
+
+    def produce():
+        try:
+            for item in items:
+                future = pool.submit(_timed, load, item, times)
+                start = time.perf_counter()
+                while not stop.is_set():
+                    try:
+                        q.put((item, future), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                times.add("read", "waiting", time.perf_counter() - start)
+                if stop.is_set():
+                    return
+        finally:
+            q.put(_DONE)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            start = time.perf_counter()
+            entry = q.get()
+            if entry is _DONE:
+                break
+            item, future = entry
+            loaded = future.result()
+            times.add("parse", "waiting", time.perf_counter() - start)
+
+            start = time.perf_counter()
+            yield (item, loaded)
+            times.add("parse", "working", time.perf_counter() - start)
+    finally:
+        # the consumer may have stopped early; let the producer go
+        stop.set()
+        while producer.is_alive():
+            try:
+                q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        pool.shutdown(wait=True)
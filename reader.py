@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+'''Reads layout files as raw bytes for the parser. Each file is memory-mapped,
+checked with a cheap byte-level prefilter, sniffed for its encoding, and
+tagged as plain-text XML or Android binary XML (AXML).'''
+
+import codecs
+import mmap
+import pathlib
+import re
+
+# The first chunk of an AXML file: RES_XML_TYPE (0x0003) with an eight-byte
+# header, little-endian.
+AXML_MAGIC = b"\x03\x00\x08\x00"
+
+# Byte-order marks, longest first so UTF-32 isn't mistaken for UTF-16.
+BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+
+# Without a BOM, the byte pattern of "<?" tells us the code unit width.
+WIDTHS = (
+    (b"<\x00\x00\x00", "utf-32-le"),
+    (b"\x00\x00\x00<", "utf-32-be"),
+    (b"<\x00?\x00", "utf-16-le"),
+    (b"\x00<\x00?", "utf-16-be"),
+)
+
+DECLARATION = re.compile(rb"""^\s*<\?xml[^>]*?encoding\s*=\s*["']([A-Za-z0-9._-]+)["']""")
+
+# The same, once decoded, for rewriting it.
+TEXT_DECLARATION = re.compile(r"""^(\s*<\?xml[^>]*?encoding\s*=\s*["'])([A-Za-z0-9._-]+)(["'])""")
+
+# Encodings whose code units are wider than a byte. libxml2 only finds these
+# from a BOM, and disagrees with the declaration when there isn't one, so
+# they're transcoded before parsing rather than passed through.
+WIDE = ("utf-16", "utf-16-le", "utf-16-be", "utf-32", "utf-32-le", "utf-32-be")
+
+# Only this many leading bytes are inspected by the prefilter and sniffer.
+SNIFF = 1024
+
+
+class SkippedLayout(Exception):
+
+    '''Raised when a layout file can't or shouldn't be parsed. Carries the path
+    and a short reason for the run report.'''
+
+    def __init__(self, path, reason: str):
+        super().__init__("{}: {}".format(path, reason))
+        self.path = path
+        self.reason = reason
+
+
+class LayoutBuffer:
+
+    '''The raw contents of one layout file. data is an mmap (or bytes, for
+    files that don't live on a real filesystem); kind is "xml" or "axml".
+    Close it, or use it as a context manager, when the parser is done.'''
+
+    def __init__(self, path, data, kind: str, encoding: str = None):
+        self.path = path
+        self.data = data
+        self.kind = kind
+        self.encoding = encoding
+
+    def __len__(self):
+        return len(self.data)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def isBinaryXml(data) -> bool:
+    '''Checks for the AXML chunk header at the start of a buffer.'''
+    return data[:4] == AXML_MAGIC
+
+
+def sniffEncoding(data) -> str:
+    '''Determines the encoding of an XML buffer from its BOM or its XML
+    declaration, defaulting to UTF-8 as the XML spec does.'''
+
+    head = data[:SNIFF]
+
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+
+    for pattern, encoding in WIDTHS:
+        if head.startswith(pattern):
+            return encoding
+
+    match = DECLARATION.match(head)
+    if match is None:
+        return "utf-8"
+
+    encoding = match.group(1).decode("ascii")
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        # let the parser complain about it; we'd only be guessing
+        return "utf-8"
+
+
+def toUtf8(data, encoding: str) -> bytes:
+    '''Transcodes an XML buffer to UTF-8, dropping any BOM and correcting
+    the declaration to match. Raises UnicodeDecodeError if the buffer isn't
+    in encoding after all.'''
+
+    text = bytes(data).decode(encoding)
+    if text.startswith("\ufeff"):
+        text = text[1:]
+    text = TEXT_DECLARATION.sub(r"\g<1>utf-8\g<3>", text, count=1)
+    return text.encode("utf-8")
+
+
+def prefilter(data) -> str:
+    '''Cheaply classifies a buffer without decoding it. Returns "axml", "xml",
+    or None if the buffer can't be a layout at all.'''
+
+    if isBinaryXml(data):
+        return "axml"
+
+    head = data[:SNIFF]
+
+    # BOMs and wide encodings can't be checked byte-wise; trust the sniffer
+    if any(head.startswith(bom) for bom, _ in BOMS):
+        return "xml"
+    if any(head.startswith(pattern) for pattern, _ in WIDTHS):
+        return "xml"
+
+    if head.lstrip()[:1] != b"<":
+        return None
+
+    return "xml"
+
+
+def openLayout(path, *, preload=False) -> LayoutBuffer:
+    '''Maps a layout file into memory and classifies it. Raises SkippedLayout
+    if the file is empty, unreadable, or obviously not XML. With preload, the
+    file is read in full right away instead of mapped, for I/O threads that
+    run ahead of the parser.'''
+
+    try:
+        if isinstance(path, pathlib.Path) and not preload:
+            with path.open('rb') as f:
+                if path.stat().st_size == 0:
+                    raise SkippedLayout(path, "empty file")
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # preloading, or e.g. a zipfile.Path with no file descriptor to map
+            data = path.read_bytes()
+            if len(data) == 0:
+                raise SkippedLayout(path, "empty file")
+    except OSError as e:
+        raise SkippedLayout(path, str(e))
+
+    kind = prefilter(data)
+
+    if kind is None:
+        buf = LayoutBuffer(path, data, None)
+        buf.close()
+        raise SkippedLayout(path, "not XML")
+
+    if kind == "axml":
+        return LayoutBuffer(path, data, kind)
+
+    return LayoutBuffer(path, data, kind, sniffEncoding(data))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+'''Places to send per-app result rows as they're produced. Every sink takes
+one row at a time with write and finishes up with close; none of them keep
+rows in memory, so a sink can take any number of apps.'''
+
+import csv
+import json
+import os
+import pathlib
+from collections import OrderedDict
+
+
+class Sink:
+
+    '''Takes rows (dictionaries with key=columnName) one at a time.'''
+
+    count = 0
+
+    def write(self, row: dict) -> None:
+        raise NotImplementedError(self)
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CallbackSink(Sink):
+
+    '''Hands each row to a function.'''
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def write(self, row: dict) -> None:
+        self.fn(row)
+        self.count += 1
+
+
+class CSVSink(Sink):
+
+    '''Writes rows to a CSV. The header is the union of every row's columns,
+    which isn't known until the end, so rows are spooled to disk and the CSV
+    is written on close. Rows already in the CSV are kept after the new ones,
+    as writeStats does. With zeros, missing values are written as 0. What it's
+    doing goes to log.'''
+
+    def __init__(self, outFile: pathlib.Path, *, zeros=False, log=lambda x: None):
+        self.outFile = outFile
+        self.zeros = zeros
+        self.log = log
+        self.header = set()
+        self.spoolFile = outFile.with_name(outFile.name + ".rows")
+        self.spool = self.spoolFile.open('w')
+
+    def write(self, row: dict) -> None:
+        self.header.update(row.keys())
+        self.spool.write(json.dumps(row) + "\n")
+        self.count += 1
+
+    def close(self) -> None:
+        if self.spool is None:
+            return
+        self.spool.close()
+        self.spool = None
+
+        # add other entries if already in the file
+        old = self.outFile.exists()
+        if old:
+            self.log("Appending data to current CSV file...")
+            with self.outFile.open('r') as f:
+                self.header.update(next(csv.reader(f), []))
+        else:
+            self.log("Creating new CSV file...")
+
+        restval = 0 if self.zeros else ''
+        tmpFile = self.outFile.with_name(self.outFile.name + ".tmp")
+        with tmpFile.open('w') as out:
+            w = csv.DictWriter(out, sorted(self.header), restval=restval)
+            w.writeheader()
+
+            with self.spoolFile.open('r') as f:
+                w.writerows( json.loads(line) for line in f )
+
+            if old:
+                with self.outFile.open('r') as f:
+                    w.writerows(csv.DictReader(f))
+
+        os.replace(tmpFile.as_posix(), self.outFile.as_posix())
+        os.remove(self.spoolFile.as_posix())
+
+
+class ColumnarSink(Sink):
+
+    '''Writes rows column by column into a directory. Each column is a sparse
+    file of "row<TAB>value" lines, the value as JSON, so a tag only costs
+    space in the rows that use it. columns.json maps column names to files
+    and gives the row count. Only a bounded number of column files are kept
+    open at once.'''
+
+    MAX_OPEN = 64
+
+    def __init__(self, outDir: pathlib.Path):
+        self.outDir = outDir
+        self.outDir.mkdir(parents=True, exist_ok=True)
+        self.columns = dict()  # column name -> file name
+        self.files = OrderedDict()  # column name -> open file, least recent first
+
+    def _file(self, column: str):
+        f = self.files.get(column)
+        if f is not None:
+            self.files.move_to_end(column)
+            return f
+
+        if column not in self.columns:
+            self.columns[column] = "{:05}.tsv".format(len(self.columns))
+            mode = 'w'
+        else:
+            mode = 'a'
+
+        if len(self.files) >= self.MAX_OPEN:
+            _, oldest = self.files.popitem(last=False)
+            oldest.close()
+
+        f = self.files[column] = (self.outDir / self.columns[column]).open(mode)
+        return f
+
+    def write(self, row: dict) -> None:
+        for column, value in row.items():
+            if value is None or value == '':
+                continue
+            self._file(column).write("{}\t{}\n".format(self.count, json.dumps(value)))
+        self.count += 1
+
+    def close(self) -> None:
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+
+        with (self.outDir / "columns.json").open('w') as f:
+            json.dump({ "rows": self.count, "columns": self.columns }, f, indent=2, sort_keys=True)
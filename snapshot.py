@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+'''What each application looked like when the last diff run finished: its
+layout and values directories, the size, modification time and fingerprint
+of every file its row was made from, and the row itself. The next run only
+has to stat those files again; apps whose files didn't change aren't read,
+let alone analyzed.'''
+
+import json
+import pathlib
+import sqlite3
+
+import dedup  # local
+
+SCHEMA = """
+create table if not exists apps (
+    key text primary key,
+    dirs text not null,
+    files text not null,
+    row text
+) without rowid;
+create table if not exists meta (
+    name text primary key,
+    value text not null
+);
+"""
+
+
+def examine(paths: [pathlib.Path, ...], old: dict = None) -> (dict, bool):
+    '''Stamps an application's files, giving { path: [size, mtime, digest] }
+    and whether the app changed since it was stamped old. A file is only read
+    (and fingerprinted) when its size or modification time isn't what old
+    says, so an untouched app costs a stat per file.'''
+
+    old = old or dict()
+    files = dict()
+    changed = False
+
+    for path in paths:
+        try:
+            st = path.stat()
+            key = str(path)
+            before = old.get(key)
+            if before is not None and before[:2] == [st.st_size, st.st_mtime_ns]:
+                files[key] = before
+                continue
+            digest = dedup.fingerprint(path.read_bytes()).hex()
+        except OSError:
+            # gone, or unreadable; either way it's not part of the app now
+            continue
+
+        files[key] = [st.st_size, st.st_mtime_ns, digest]
+        if before is None or before[2] != digest:
+            changed = True
+
+    if files.keys() != old.keys():
+        changed = True
+
+    return (files, changed)
+
+
+class Snapshot:
+
+    '''Per-app state stored in an SQLite file, keyed by aguille.appName, so
+    an app that gains or loses a directory is still the same app. Nothing is
+    written until commit, so a run that dies part way leaves the last
+    finished run's state for the next one to diff against.'''
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.db = sqlite3.connect(str(path))
+        self.db.executescript(SCHEMA)
+
+    def settings(self) -> dict:
+        '''The settings the stored rows were made with, or None.'''
+        found = self.db.execute("select value from meta where name = 'settings'").fetchone()
+        return None if found is None else json.loads(found[0])
+
+    def setSettings(self, settings: dict) -> None:
+        self.db.execute("insert or replace into meta (name, value) values ('settings', ?)",
+                (json.dumps(settings, sort_keys=True),))
+
+    def keys(self) -> set:
+        '''Every application in the snapshot.'''
+        return { k for k, in self.db.execute("select key from apps") }
+
+    def get(self, key: str) -> (list, dict, dict):
+        '''Gives an application's directories, its stamped files and its row
+        (None if it didn't get one), or None if the app isn't in the
+        snapshot.'''
+        found = self.db.execute("select dirs, files, row from apps where key = ?", (key,)).fetchone()
+        if found is None:
+            return None
+        dirs, files, row = found
+        return (json.loads(dirs), json.loads(files), None if row is None else json.loads(row))
+
+    def put(self, key: str, dirs: list, files: dict, row: dict) -> None:
+        self.db.execute("insert or replace into apps (key, dirs, files, row) values (?, ?, ?, ?)",
+                (key, json.dumps(dirs), json.dumps(files, sort_keys=True),
+                    None if row is None else json.dumps(row, sort_keys=True)))
+
+    def forget(self, key: str) -> None:
+        self.db.execute("delete from apps where key = ?", (key,))
+
+    def commit(self) -> None:
+        self.db.commit()
+
+    def close(self) -> None:
+        self.db.close()
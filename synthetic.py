@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+'''Generates synthetic Android repositories for benchmarks and tests. The same
+seed and parameters always give byte-for-byte the same corpus.'''
+
+import json
+import pathlib
+import random
+from xml.sax.saxutils import quoteattr
+
+LAYOUTS = {
+    "LinearLayout": 6,
+    "FrameLayout": 2,
+    "RelativeLayout": 3,
+    "TableLayout": 1,
+}
+
+WIDGETS = {
+    "TextView": 10,
+    "Button": 6,
+    "ImageView": 4,
+    "EditText": 3,
+    "CheckBox": 1,
+    "ProgressBar": 1,
+    "android.support.v7.widget.RecyclerView": 1,
+    "com.example.widget.FancyView": 1,
+}
+
+SIZES = ("match_parent", "wrap_content", "48dp", "120dp", "1in", "20mm")
+TEXT_SIZES = ("12sp", "14sp", "18sp", "24sp")
+WORDS = ("OK", "Cancel", "Settings", "Hello, world!", "Connect", "About", "Share")
+
+ANDROID = "http://schemas.android.com/apk/res/android"
+
+
+def _pick(rng: random.Random, weights: dict) -> str:
+    names = sorted(weights)
+    return rng.choices(names, [ weights[n] for n in names ])[0]
+
+
+class Corpus:
+
+    '''Knobs for a synthetic repository. tagMix weighs the widgets that fill
+    each layout; layouts are nested up to depth levels deep.'''
+
+    def __init__(self, *, seed=0, apps=20, layouts=10, depth=4, children=4,
+            strings=30, tagMix=None, ratings=True, values=True):
+        self.seed = seed
+        self.apps = apps
+        self.layouts = layouts
+        self.depth = depth
+        self.children = children
+        self.strings = strings
+        self.tagMix = dict(WIDGETS if tagMix is None else tagMix)
+        self.ratings = ratings
+        self.values = values
+
+    def params(self) -> dict:
+        '''The knobs, for recording alongside results.'''
+        return dict(vars(self))
+
+    def write(self, root: pathlib.Path) -> [pathlib.Path, ...]:
+        '''Writes the repository under root and lists its applications.'''
+
+        rng = random.Random(self.seed)
+        root.mkdir(parents=True, exist_ok=True)
+
+        apps = []
+        for a in range(self.apps):
+            app = root / "org.example.app{:05}".format(a)
+            self._writeApp(app, rng)
+            apps.append(app)
+
+        return apps
+
+    def _writeApp(self, app: pathlib.Path, rng: random.Random):
+        res = app / "src" / "main" / "res"
+        layouts = res / "layout"
+        layouts.mkdir(parents=True, exist_ok=True)
+
+        for l in range(self.layouts):
+            xml = self.layout(rng)
+            (layouts / "layout_{:03}.xml".format(l)).write_text(xml, encoding="utf-8")
+
+        if self.values:
+            values = res / "values"
+            values.mkdir(parents=True, exist_ok=True)
+            (values / "strings.xml").write_text(self.stringsXml(rng), encoding="utf-8")
+            (values / "dimens.xml").write_text(self.dimensXml(rng), encoding="utf-8")
+
+        if self.ratings:
+            stars = [ rng.randint(0, 500) for _ in range(5) ]
+            total = sum(stars)
+            mean = sum(( (i + 1) * n for i, n in enumerate(stars) )) / total if total else 0
+            rating = { "0": round(mean, 3) }
+            rating.update({ str(i + 1): n for i, n in enumerate(stars) })
+            (app / "rating.json").write_text(json.dumps(rating, sort_keys=True), encoding="utf-8")
+
+    def layout(self, rng: random.Random) -> str:
+        '''One layout file's worth of XML.'''
+        lines = ['<?xml version="1.0" encoding="utf-8"?>']
+        self._element(lines, rng, 0, root=True)
+        return "\n".join(lines) + "\n"
+
+    def _attributes(self, rng: random.Random, widget: bool) -> str:
+        attrs = [
+            ("android:layout_width", rng.choice(SIZES)),
+            ("android:layout_height", rng.choice(SIZES)),
+        ]
+        if rng.random() < 0.5:
+            attrs.append(("android:id", "@+id/view{}".format(rng.randint(0, 9999))))
+        if widget and rng.random() < 0.7:
+            if self.values and rng.random() < 0.6:
+                attrs.append(("android:text", "@string/s{}".format(rng.randrange(self.strings))))
+            else:
+                attrs.append(("android:text", rng.choice(WORDS)))
+            if self.values and rng.random() < 0.3:
+                attrs.append(("android:textSize", "@dimen/text{}".format(rng.randrange(len(TEXT_SIZES)))))
+        if not widget:
+            attrs.append(("android:orientation", rng.choice(("horizontal", "vertical"))))
+        return " ".join( "{}={}".format(k, quoteattr(v)) for k, v in attrs )
+
+    def _element(self, lines: [str], rng: random.Random, level: int, *, root=False):
+        indent = "    " * level
+        nested = level < self.depth - 1
+
+        name = _pick(rng, LAYOUTS)
+        ns = ' xmlns:android="{}"'.format(ANDROID) if root else ''
+        lines.append("{}<{}{} {}>".format(indent, name, ns, self._attributes(rng, False)))
+
+        for _ in range(rng.randint(1, self.children)):
+            if nested and rng.random() < 0.3:
+                self._element(lines, rng, level + 1)
+            else:
+                widget = _pick(rng, self.tagMix)
+                lines.append("{}    <{} {} />".format(indent, widget, self._attributes(rng, True)))
+
+        lines.append("{}</{}>".format(indent, name))
+
+    def stringsXml(self, rng: random.Random) -> str:
+        lines = ['<?xml version="1.0" encoding="utf-8"?>', "<resources>"]
+        for i in range(self.strings):
+            lines.append('    <string name="s{}">{}</string>'.format(i, rng.choice(WORDS)))
+        lines.append("</resources>")
+        return "\n".join(lines) + "\n"
+
+    def dimensXml(self, rng: random.Random) -> str:
+        lines = ['<?xml version="1.0" encoding="utf-8"?>', "<resources>"]
+        for i, size in enumerate(TEXT_SIZES):
+            lines.append('    <dimen name="text{}">{}</dimen>'.format(i, size))
+        lines.append("</resources>")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+'''A persistent inverted index over analysis results. Each tag maps to a
+posting list of (app id, count) sorted by app id, and each app keeps its
+package and rating fields, so questions about tags can be answered without
+rescanning layouts or loading the whole CSV.'''
+
+import json
+import pathlib
+import sqlite3
+
+TAG_PREFIX = "tag_"
+
+SCHEMA = """
+create table if not exists apps (
+    id integer primary key,
+    package text unique not null,
+    fields text not null
+);
+create table if not exists postings (
+    tag text not null,
+    app integer not null,
+    count integer not null,
+    primary key (tag, app)
+) without rowid;
+"""
+
+# rows added between commits while building
+BATCH = 200
+
+
+def tagName(column: str) -> str:
+    '''Turns a tag as written on the command line or as a CSV column into the
+    name it's indexed under.'''
+    if column.startswith(TAG_PREFIX):
+        return column[len(TAG_PREFIX):]
+    return column
+
+
+class TagIndex:
+
+    '''An inverted index stored in an SQLite file. Postings are clustered by
+    (tag, app), so each posting list is stored, and read back, in app order.'''
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.db = sqlite3.connect(str(path))
+        self.db.executescript(SCHEMA)
+        self.pending = 0
+
+    def add(self, row: dict) -> None:
+        '''Indexes one CSV row. Adding a package again replaces it.'''
+
+        package = row["package"]
+        fields = { k: v for k, v in row.items() if k != "package" and not k.startswith(TAG_PREFIX) }
+        postings = [ (tagName(k), int(v)) for k, v in row.items() if k.startswith(TAG_PREFIX) and v ]
+
+        cur = self.db.execute("select id from apps where package = ?", (package,))
+        found = cur.fetchone()
+        if found is None:
+            cur = self.db.execute("insert into apps (package, fields) values (?, ?)",
+                    (package, json.dumps(fields, sort_keys=True)))
+            app = cur.lastrowid
+        else:
+            app, = found
+            self.db.execute("update apps set fields = ? where id = ?",
+                    (json.dumps(fields, sort_keys=True), app))
+            self.db.execute("delete from postings where app = ?", (app,))
+
+        self.db.executemany("insert into postings (tag, app, count) values (?, ?, ?)",
+                ( (tag, app, count) for tag, count in postings ))
+
+        self.pending += 1
+        if self.pending >= BATCH:
+            self.commit()
+
+    def commit(self) -> None:
+        self.db.commit()
+        self.pending = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.db.close()
+
+    def postings(self, tag: str, minimum: int = 1) -> [(int, int), ...]:
+        '''The posting list for a tag: (app id, count) for every app using the
+        tag at least minimum times, in app order.'''
+        cur = self.db.execute(
+                "select app, count from postings where tag = ? and count >= ? order by app",
+                (tagName(tag), minimum))
+        return cur.fetchall()
+
+    def query(self, terms: [("tag", "minimum"), ...]) -> [(int, [int, ...]), ...]:
+        '''Finds apps using every tag in terms at least its minimum number of
+        times. Gives (app id, [count per term]) in app order.'''
+
+        if len(terms) == 0:
+            return []
+
+        lists = [ self.postings(tag, minimum) for tag, minimum in terms ]
+
+        # intersect, starting from the shortest list
+        order = sorted(range(len(lists)), key=lambda i: len(lists[i]))
+        matches = { app: [None] * len(terms) for app, _ in lists[order[0]] }
+        for i in order:
+            found = dict()
+            for app, count in lists[i]:
+                if app in matches:
+                    counts = matches[app]
+                    counts[i] = count
+                    found[app] = counts
+            matches = found
+
+        return sorted(matches.items())
+
+    def app(self, app: int) -> (str, dict):
+        '''Gives the package and rating fields of an app id.'''
+        package, fields = self.db.execute(
+                "select package, fields from apps where id = ?", (app,)).fetchone()
+        return (package, json.loads(fields))
+
+    def tags(self) -> [str, ...]:
+        '''Lists every indexed tag.'''
+        return [ t for t, in self.db.execute("select distinct tag from postings order by tag") ]
+
+
+def parseTerm(term: str, minimum: int = 1) -> ("tag", "minimum"):
+    '''Reads a query term, written TAG or TAG:MINIMUM.'''
+    tag, sep, n = term.rpartition(':')
+    if sep and n.isdigit():
+        return (tag, int(n))
+    return (term, minimum)
@@ -1,10 +1,436 @@
 #!/usr/bin/env python3
 
+import csv
+import io
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
 from pathlib import Path
+import tempfile
+import threading
+import time
+import zipfile
 
 import android
 import aguille
+import axml
+import bench
+import dedup
 from devices import galaxyS3
+import parsers
+import pipeline
+import reader
+import sinks
+import snapshot
+import synthetic
+import tagindex
+
+# How much slower than a bare interpreter "aguille.py --version" may start,
+# in bare interpreter start times, so a loaded machine slows both alike. Set
+# AGUILLE_STARTUP_BUDGET to allow more, or "inf" to only check what's loaded.
+STARTUP_BUDGET = float(os.environ.get("AGUILLE_STARTUP_BUDGET", 6))
+
+# Modules that must not be loaded just by importing aguille or android.
+HEAVY = ("bs4", "lxml", "pygame", "statistics", "docopt", "subprocess", "concurrent", "zipfile")
+
+print("\nTESTING STARTUP BUDGET")
+loaded = { m.split('.')[0] for m in bench.importedBy("import aguille, android, devices") }
+assert not loaded.intersection(HEAVY), sorted(loaded.intersection(HEAVY))
+overhead, bare = bench.startupOverhead()
+print("{:.3f}s over a bare interpreter's {:.3f}s".format(overhead, bare))
+assert overhead < STARTUP_BUDGET * bare, \
+        "startup took {:.1f} times as long as a bare interpreter, more than {}".format(overhead / bare, STARTUP_BUDGET)
+
+print("\nTESTING READER")
+FIXTURES = Path(__file__).resolve().with_name("fixtures")
+with reader.openLayout(FIXTURES / "utf16le-nobom.xml") as buf:
+    assert buf.encoding == "utf-16-le", buf.encoding
+    names = list(parsers.get().tagNames(aguille.bufferSoup(buf)))
+assert names == ["LinearLayout", "Button", "TextView"], names
+try:
+    with reader.openLayout(FIXTURES / "no-elements.xml") as buf:
+        aguille.bufferSoup(buf)
+    assert False, "a layout without elements wasn't skipped"
+except reader.SkippedLayout as e:
+    print(e)
+
+print("\nTESTING BINARY XML")
+apk = FIXTURES / "app.apk"
+table = axml.apkResources(str(apk))
+assert table.name(0x7f010000) == "string/greeting"
+assert table.value("string/greeting") == "Hello!"
+with zipfile.ZipFile(str(apk)) as zf:
+    events = list(axml.events(zf.read("res/layout/main.xml"), table))
+assert events == [
+    ("start", "LinearLayout", { "android:orientation": "vertical", "android:layout_width": "match_parent" }),
+    ("start", "Button", { "android:text": "@string/greeting", "android:layout_height": "wrap_content",
+            "android:textSize": "16sp" }),
+    ("end", "Button", None),
+    ("start", "com.example.Custom", { "android:label": "hi" }),
+    ("end", "com.example.Custom", None),
+    ("end", "LinearLayout", None),
+], events
+apkDirs = aguille._getApkDirs(FIXTURES)
+assert apkDirs == [([apk], [apk])], apkDirs
+assert android.resource("@string/greeting", apkDirs[0][1]) == "Hello!"
+tags = aguille.countAppTags(aguille.apkLayouts([apk]))
+assert tags["tag_Button"] == 2 and tags["tag_com.example.Custom"] == 2, tags
+with zipfile.ZipFile(str(apk)) as zf:
+    arsc = zf.read("resources.arsc")
+    layout = zf.read("res/layout/main.xml")
+header = struct.pack("<HHII", 0x0002, 12, 20, 1)
+for corrupt in (arsc[:40], header + struct.pack("<HHI", 0, 8, 0), header + struct.pack("<HHI", 0, 8, 4096)):
+    try:
+        axml.ResourceTable(corrupt)
+        assert False, "a corrupt resource table was read"
+    except axml.AxmlError as e:
+        print(e)
+# an APK whose table is broken still has its layouts counted
+broken = tempfile.TemporaryDirectory()
+brokenApk = Path(broken.name) / "broken.apk"
+with zipfile.ZipFile(str(brokenApk), 'w') as zf:
+    zf.writestr("res/layout/main.xml", layout)
+    zf.writestr("resources.arsc", arsc[:40])
+skipped = []
+tags = aguille.countAppTags(aguille.apkLayouts([brokenApk]), skipped=skipped)
+assert tags["tag_Button"] == 1 and skipped == [], (tags, skipped)
+
+print("\nTESTING STYLE RESOLUTION")
+styled = tempfile.TemporaryDirectory()
+main = Path(styled.name) / "src" / "main"
+(main / "res" / "values").mkdir(parents=True)
+(main / "AndroidManifest.xml").write_text(
+        '<manifest xmlns:android="http://schemas.android.com/apk/res/android">'
+        '<application android:theme="@style/AppTheme"/></manifest>')
+(main / "res" / "values" / "styles.xml").write_text("""<resources>
+    <style name="AppTheme" parent="@android:style/Theme.Light">
+        <item name="buttonSize">20sp</item>
+    </style>
+    <style name="Base"><item name="android:layout_width">wrap_content</item></style>
+    <style name="Base.Button"><item name="android:textSize">?attr/buttonSize</item></style>
+    <style name="Loop" parent="Loop"/>
+    <string name="hello">@string/greeting</string>
+    <string name="greeting">Hello</string>
+</resources>""")
+values = [main / "res" / "values"]
+resources = android.appResources(values)
+assert resources.theme == "AppTheme", resources.theme
+assert resources.style("Base.Button") == {
+        "android:layout_width": "wrap_content", "android:textSize": "?attr/buttonSize" }
+assert resources.style("Loop") == dict()
+assert android.resource("@string/hello", values) == "Hello"
+assert android.resource("@string/missing", values) == "@string/missing"
+assert android.resource("?attr/buttonSize", values) == "20sp"
+assert android.appResources(values) is resources
+button = parsers.bs('<Button xmlns:android="http://schemas.android.com/apk/res/android" '
+        'style="@style/Base.Button" android:text="@string/hello"/>').find("Button")
+attrs = android.attributes(button, values)
+print(attrs)
+assert attrs["android:textSize"] == "20sp" and attrs["android:text"] == "Hello"
+
+print("\nTESTING PARSER PARITY")
+corpus = tempfile.TemporaryDirectory()
+apps = synthetic.Corpus(seed=1, apps=3, layouts=10).write(Path(corpus.name))
+
+def parity(layoutPath):
+    results = dict()
+    for name in parsers.PARSERS:
+        with reader.openLayout(layoutPath) as buf:
+            doc = aguille.bufferSoup(buf, parser=name)
+        results[name] = (
+            list(parsers.get(name).tagNames(doc)),
+            aguille.countTags(doc, parser=name),
+            aguille.countTags(doc, custom=False, parser=name),
+            aguille.countLayoutButtons(doc, parser=name),
+        )
+    assert results["lxml"] == results["bs4"], (layoutPath, results)
+    return results["bs4"]
+
+for app in apps:
+    res = app / "src" / "main" / "res"
+    for layoutPath in sorted((res / "layout").iterdir()):
+        parity(layoutPath)
+    for name in parsers.PARSERS:
+        assert aguille.countAppTags([res / "layout"], parser=name) == aguille.countAppTags([res / "layout"])
+    appValues = [ android.appResources([res / "values"], parser=name) for name in parsers.PARSERS ]
+    assert len({ repr((r.values, r.styles, r.theme)) for r in appValues }) == 1, app
+for name in parsers.PARSERS:
+    r = android.appResources(values, parser=name)
+    assert (r.values, r.styles, r.theme) == (resources.values, resources.styles, resources.theme), name
+
+# encodings libxml2 can't be told about by their Python names, markup that
+# needs recovering, and binary XML out of an APK
+odd = Path(corpus.name) / "odd"
+(odd / "values").mkdir(parents=True)
+layout = '<LinearLayout><Button android:text="{}"/><com.example.Custom/></LinearLayout>'
+for filename, encoding, declared, text in (
+        ("utf16.xml", "utf-16", "UTF-16", "héllo"),
+        ("utf32be.xml", "utf-32-be", "UTF-32", "héllo"),
+        ("latin1.xml", "latin-1", "ISO-8859-1", "héllo"),
+        ("eucjp.xml", "euc_jp", "EUC-JP", "日本"),
+        ("macroman.xml", "mac-roman", "macintosh", "héllo")):
+    (odd / filename).write_bytes(('<?xml version="1.0" encoding="{}"?>'.format(declared)
+            + layout.format(text)).encode(encoding))
+(odd / "malformed.xml").write_bytes(b'<LinearLayout><Button><TextView></LinearLayout><Foo a="')
+for layoutPath in sorted(odd.glob("*.xml")):
+    names, *_ = parity(layoutPath)
+    assert names[:2] == ["LinearLayout", "Button"], (layoutPath, names)
+assert parity(FIXTURES / "utf16le-nobom.xml")[0] == ["LinearLayout", "Button", "TextView"]
+for layoutDir in aguille.apkLayouts([apk]):
+    for layoutPath in layoutDir.iterdir():
+        assert parity(layoutPath)[0] == ["LinearLayout", "Button", "com.example.Custom"], layoutPath
+(odd / "values" / "strings.xml").write_bytes('<?xml version="1.0" encoding="ISO-8859-1"?>'
+        '<resources><string name="greeting">Grüß dich</string></resources>'.encode("latin-1"))
+for name in parsers.PARSERS:
+    r = android.appResources([odd / "values"], parser=name)
+    assert android.resource("@string/greeting", [odd / "values"]) == r.resolve("@string/greeting") == "Grüß dich", name
+print("{} parsers agree".format(len(parsers.PARSERS)))
+
+print("\nTESTING PREFETCH")
+
+def slowSquare(i):
+    # later items load faster, so they'd finish first if order weren't kept
+    time.sleep(0.002 * (10 - i % 10))
+    if i == 13:
+        raise ValueError(i)
+    return i * i
+
+for depth, workers in ((0, 1), (1, 1), (4, 4)):
+    times = pipeline.StageTimes()
+    assert list(pipeline.prefetch(range(13), slowSquare, depth=depth, workers=workers, times=times)) == \
+            [ (i, i * i) for i in range(13) ], (depth, workers)
+    assert times.get("read", "working") > 0
+    got = []
+    try:
+        for item, loaded in pipeline.prefetch(range(20), slowSquare, depth=depth, workers=workers):
+            got.append(item)
+        assert False, "an exception from load went missing"
+    except ValueError as e:
+        assert e.args == (13,) and got == list(range(13)), (e, got)
+    # stopping early doesn't wait for the rest, and doesn't hang
+    items = pipeline.prefetch(range(10000), slowSquare, depth=depth, workers=workers)
+    next(items)
+    closer = threading.Thread(target=items.close, daemon=True)
+    closer.start()
+    closer.join(timeout=10)
+    assert not closer.is_alive(), (depth, workers)
+
+print("\nTESTING DEDUP")
+copied = tempfile.TemporaryDirectory()
+apps = synthetic.Corpus(seed=3, apps=3, layouts=6).write(Path(copied.name))
+layoutDir = apps[0] / "src" / "main" / "res" / "layout"
+(layoutDir / "broken.xml").write_bytes((FIXTURES / "no-elements.xml").read_bytes())
+shutil.copytree(str(apps[0]), str(apps[0].with_name("fork")))
+plain = list(aguille.analyzeRepository(copied.name, prefetch=0))
+layoutCache = dedup.LayoutCache()
+skipped = []
+cached = list(aguille.analyzeRepository(copied.name, prefetch=0, cache=layoutCache, skipped=skipped))
+assert cached == plain
+assert layoutCache.hits >= 7 and layoutCache.reread >= 7, vars(layoutCache)
+fork = apps[0].with_name("fork") / "src" / "main" / "res" / "layout"
+assert sorted( p for p, _ in skipped ) == sorted([layoutDir / "broken.xml", fork / "broken.xml"]), skipped
+# results depend on custom and parser, so a shared cache keeps them apart
+for custom in (False, True):
+    for name in parsers.PARSERS:
+        shared = list(aguille.analyzeRepository(copied.name, prefetch=0, custom=custom, parser=name, cache=layoutCache))
+        assert shared == list(aguille.analyzeRepository(copied.name, prefetch=0, custom=custom, parser=name)), (custom, name)
+print(layoutCache.hits, "duplicates")
+
+print("\nTESTING RESUME")
+AGUILLE = Path(__file__).resolve().with_name("aguille.py")
+cli = lambda *argv: subprocess.run([sys.executable, str(AGUILLE)] + [ str(a) for a in argv ],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+resumed = tempfile.TemporaryDirectory()
+repo = Path(resumed.name) / "repo"
+synthetic.Corpus(seed=4, apps=8, layouts=4).write(repo)
+# folders with nothing to analyze mustn't trip up resuming
+(repo / "empty1").mkdir()
+(repo / "empty2").mkdir()
+full, part = Path(resumed.name) / "full.csv", Path(resumed.name) / "part.csv"
+ck = Path(resumed.name) / "ck.jsonl"
+assert cli("tags", "--custom", "-o", full, "--checkpoint", ck, "--repo", repo).returncode == 0
+lines = ck.read_bytes().splitlines(keepends=True)
+# cut off mid-file, part way through a line, as a killed run would leave it
+ck.write_bytes(b''.join(lines[:-3]) + lines[-3][:20])
+run = cli("tags", "--custom", "-o", part, "--checkpoint", ck, "--resume", "--repo", repo)
+assert run.returncode == 0 and "applications analyzed" in run.stdout, run.stdout
+assert part.read_bytes() == full.read_bytes()
+# a checkpoint from a run with other settings isn't resumed
+part.unlink()
+run = cli("tags", "-o", part, "--checkpoint", ck, "--resume", "--repo", repo)
+assert run.returncode == 2 and not part.exists(), run.stdout
+assert cli("tags", "-o", part, "--resume", "--repo", repo).returncode == 2
+print(run.stdout.strip())
+
+print("\nTESTING DIFF")
+changing = tempfile.TemporaryDirectory()
+apps = synthetic.Corpus(seed=2, apps=4, layouts=3).write(Path(changing.name))
+dirs = [ ([app / "src" / "main" / "res" / "layout"], [app / "src" / "main" / "res" / "values"]) for app in apps ]
+snap = snapshot.Snapshot(Path(changing.name) / "state")
+counts = dict()
+diff = lambda dirs: list(aguille.diffApps(dirs, snap, prefetch=0, root=Path(changing.name), counts=counts))
+assert len(diff(dirs)) > 0
+assert counts["added"] == len(apps), counts
+assert diff(dirs) == []
+assert counts["unchanged"] == len(apps), counts
+layoutPath = sorted(dirs[0][0][0].iterdir())[0]
+head, _, tail = layoutPath.read_text().rpartition("</")
+layoutPath.write_text(head + "<Switch/></" + tail)
+delta = diff(dirs[1:] + dirs[:1])
+print(delta)
+assert [ (d["change"], d["column"]) for d in delta ] == [ ("changed", "tag_Switch") ], delta
+# an app that gains a layout directory is the same app, changed
+res = dirs[1][0][0].parent
+(res / "layout-land").mkdir()
+for layoutPath in dirs[1][0][0].iterdir():
+    (res / "layout-land" / layoutPath.name).write_bytes(layoutPath.read_bytes())
+dirs[1] = ([res / "layout", res / "layout-land"], dirs[1][1])
+delta = diff(dirs)
+assert { d["change"] for d in delta } == {"changed"} and counts["changed"] == 1, (delta, counts)
+assert "layoutCount" in { d["column"] for d in delta }, delta
+# and so is one that only gains a values directory, though its row is the same
+(res / "values-v21").mkdir()
+dirs[1] = (dirs[1][0], dirs[1][1] + [res / "values-v21"])
+assert diff(dirs) == [] and counts["changed"] == 1, counts
+assert diff(dirs) == [] and counts["unchanged"] == len(apps), counts
+delta = diff(dirs[1:])
+assert { d["change"] for d in delta } == {"removed"} and counts["removed"] == 1, counts
+# an APK's rating lives next to it, and is part of its state too
+apkFolder = Path(changing.name) / "apks"
+apkFolder.mkdir()
+(apkFolder / "app.apk").write_bytes(apk.read_bytes())
+(apkFolder / "rating.json").write_text('{"0": 4.0, "1": 1, "2": 0, "3": 0, "4": 0, "5": 2}')
+snap = snapshot.Snapshot(Path(changing.name) / "apks.state")
+apkDirs = aguille._getApkDirs(apkFolder, log=lambda x: None, status=lambda x: None)
+diff = lambda dirs: list(aguille.diffApps(dirs, snap, prefetch=0, root=apkFolder, counts=counts))
+assert len(diff(apkDirs)) > 0 and counts["added"] == 1, counts
+(apkFolder / "rating.json").write_text('{"0": 3.0, "1": 1, "2": 0, "3": 1, "4": 0, "5": 1}')
+delta = diff(apkDirs)
+assert counts["changed"] == 1 and { d["column"] for d in delta } == {"0", "3", "5"}, (delta, counts)
+
+print("\nTESTING SHARDS")
+here = os.getcwd()
+os.chdir(changing.name)
+try:
+    relative = [ ([Path(os.path.relpath(str(l), changing.name)) for l in ls], []) for ls, _ in dirs ]
+    assert [ aguille.appName(pair, Path(".")) for pair in relative ] == \
+            [ aguille.appName(pair, Path(changing.name)) for pair in dirs ] == \
+            [ app.name for app in apps ]
+    for k in (1, 2, 3):
+        assert [ aguille.inShard(pair, k, 3, Path(".")) for pair in relative ] == \
+                [ aguille.inShard(pair, k, 3, Path(changing.name)) for pair in dirs ]
+finally:
+    os.chdir(here)
+
+print("\nTESTING MERGE")
+merging = Path(changing.name) / "merge"
+merging.mkdir()
+(merging / "a.csv").write_text("package,app,tag_A\n/x/one/res/layout,one,1\n/x/two/res/layout,,2\n")
+# the same app found somewhere else, and the same package without an app name
+(merging / "b.csv").write_text("package,app,tag_B\n/y/one/res/layout,one,5\n/x/two/res/layout,,3\n/y/three/res/layout,three,4\n")
+(merging / "c.csv").write_text("package,tag_A\n/x/four/res/layout,7\n")
+readCsv = lambda p: list(csv.reader(p.open()))
+merged = merging / "zeros.csv"
+aguille.mergeStats(merged, [ merging / n for n in ("a.csv", "b.csv", "c.csv") ], zeros=True)
+assert readCsv(merged) == [
+    ["app", "package", "tag_A", "tag_B"],
+    ["one", "/x/one/res/layout", "1", "0"],
+    ["", "/x/two/res/layout", "2", "0"],
+    ["three", "/y/three/res/layout", "0", "4"],
+    ["", "/x/four/res/layout", "7", "0"],
+], readCsv(merged)
+merged = merging / "blanks.csv"
+aguille.mergeStats(merged, [ merging / n for n in ("a.csv", "b.csv", "c.csv") ])
+assert readCsv(merged)[3:] == [["three", "/y/three/res/layout", "", "4"], ["", "/x/four/res/layout", "7", ""]], readCsv(merged)
+# merging into a CSV keeps what's in it, and what's in it wins
+merged = merging / "existing.csv"
+merged.write_text("package,app,tag_C\n/z/one/res/layout,one,9\n")
+aguille.mergeStats(merged, [merging / "a.csv", merging / "b.csv"])
+assert readCsv(merged) == [
+    ["app", "package", "tag_A", "tag_B", "tag_C"],
+    ["one", "/z/one/res/layout", "", "", "9"],
+    ["", "/x/two/res/layout", "2", "", ""],
+    ["three", "/y/three/res/layout", "", "4", ""],
+], readCsv(merged)
+
+print("\nTESTING TAG INDEX")
+indexed = tempfile.TemporaryDirectory()
+indexPath = Path(indexed.name) / "tags.sqlite"
+index = tagindex.TagIndex(indexPath)
+index.add({ "package": "a", "0": "4.5", "tag_Button": "3", "tag_TextView": "1" })
+index.add({ "package": "b", "0": "2.0", "tag_Button": "1", "tag_Switch": "2", "tag_TextView": "" })
+index.add({ "package": "c", "0": "1.0", "tag_Button": "5" })
+# added again: c no longer has buttons at all
+index.add({ "package": "c", "0": "3.0", "tag_Switch": "4" })
+index.close()
+assert tagindex.parseTerm("Button") == ("Button", 1)
+assert tagindex.parseTerm("tag_Button:3") == ("tag_Button", 3)
+assert tagindex.parseTerm("Switch", 2) == ("Switch", 2)
+index = tagindex.TagIndex(indexPath)
+assert index.tags() == ["Button", "Switch", "TextView"], index.tags()
+named = lambda matches: [ (index.app(app)[0], counts) for app, counts in matches ]
+assert named(index.query([("Button", 1)])) == named(index.query([("tag_Button", 1)])) == [("a", [3]), ("b", [1])]
+assert named(index.query([("Button", 2)])) == [("a", [3])]
+assert named(index.query([("Switch", 1), ("Button", 1)])) == [("b", [2, 1])]
+assert named(index.query([("Switch", 1), ("TextView", 1)])) == []
+assert index.app(index.query([("Switch", 4)])[0][0]) == ("c", { "0": "3.0" })
+index.close()
+out = io.StringIO()
+assert aguille.queryIndex(indexPath, [tagindex.parseTerm("tag_Button"), tagindex.parseTerm("Switch")], out=out) == 1
+assert out.getvalue().splitlines() == ["package,tag_Button,tag_Switch", "b,1,2"], out.getvalue()
+out = io.StringIO()
+aguille.queryIndex(indexPath, [tagindex.parseTerm("Button:1")], fields=True, out=out)
+assert out.getvalue().splitlines() == ["package,tag_Button,0", "a,3,4.5", "b,1,2.0"], out.getvalue()
+out = io.StringIO()
+assert aguille.queryIndex(indexPath, [("Switch", 1)], countOnly=True, out=out) == 2
+assert out.getvalue() == "2\n", out.getvalue()
+
+print("\nTESTING LIBRARY")
+
+def stdoutOf(fn):
+    '''Runs fn with file descriptor 1 going to a file, so output from child
+    processes is caught too, and gives what was written there.'''
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with tempfile.TemporaryFile() as f:
+        os.dup2(f.fileno(), 1)
+        try:
+            fn()
+            sys.stdout.flush()
+        finally:
+            os.dup2(saved, 1)
+            os.close(saved)
+        f.seek(0)
+        return f.read()
+
+library = tempfile.TemporaryDirectory()
+rows = []
+assert stdoutOf(lambda: rows.extend(aguille.analyzeRepository(repo, custom=True, prefetch=2, readers=2))) == b''
+assert len(rows) == 8 and all( row["app"].startswith("org.example.") for row in rows ), rows
+seen = []
+assert aguille.writeRows(rows, sinks.CallbackSink(seen.append)) == len(rows) and seen == rows
+outFile = Path(library.name) / "rows.csv"
+assert stdoutOf(lambda: aguille.writeRows(rows, sinks.CSVSink(outFile))) == b''
+written = list(csv.DictReader(outFile.open()))
+assert [ { k: v for k, v in row.items() if v != '' } for row in written ] == \
+        [ { k: str(v) for k, v in row.items() } for row in rows ], written
+assert (Path(library.name) / "rows.csv.rows").exists() is False
+# writing again keeps the rows already there, after the new ones
+aguille.writeRows(rows[:2], sinks.CSVSink(outFile, zeros=True))
+assert [ row["app"] for row in csv.DictReader(outFile.open()) ] == [ row["app"] for row in rows[:2] + rows ]
+columnar = Path(library.name) / "columns"
+assert aguille.writeRows(rows, sinks.ColumnarSink(columnar)) == len(rows)
+layout = json.loads((columnar / "columns.json").read_text())
+assert layout["rows"] == len(rows)
+rebuilt = [ dict() for _ in range(layout["rows"]) ]
+for column, filename in layout["columns"].items():
+    for line in (columnar / filename).read_text().splitlines():
+        i, value = line.split("\t")
+        rebuilt[int(i)][column] = json.loads(value)
+assert rebuilt == [ { k: v for k, v in row.items() if v not in (None, '') } for row in rows ]
 
 print("\nTESTING TEXT DIMENSION PROBING")
 w, h = galaxyS3.textDimensions("Hello, world!")
@@ -16,11 +442,15 @@ print(w, h)
 
 print("\nTESTING LEXER")
 
-xmlLayouts = aguille.appSoup(Path("/home/qguvernator/fdroid/org.torproject.android/src/res/layout/"))
+root = tempfile.TemporaryDirectory()
+app, = synthetic.Corpus(apps=1, layouts=5).write(Path(root.name))
+res = app / "src" / "main" / "res"
+
+xmlLayouts, _ = aguille.appSoup(res / "layout")
 layouts = []
 
 for layout in xmlLayouts:
-    layouts.append(android.AndroidElement.dispatchFromSoup(None, layout, None, device=galaxyS3))
+    layouts.append(android.AndroidElement.dispatchFromSoup(None, layout, [res / "values"], device=galaxyS3))
 
 print("\nTESTING BUTTON DIMENSION CALCULATION")
 